@@ -0,0 +1,272 @@
+# Process-wide OpenAI client pool and token-bucket request scheduler
+#
+# Streamlit sessions, worker threads and the batch CLI all get their clients here. One OpenAI
+# client (and its HTTP connection pool) is kept per API key, and every call waits its turn in a
+# per-key, per-model scheduler that tracks requests and tokens per minute, so bursts queue up
+# instead of failing with 429s.
+import hashlib
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from evaluation import ANALYSIS_MODEL, EMBEDDING_MODEL, get_encoding
+from lazy_imports import lazy_import
+from tracing import Span
+
+# The SDK is the slowest import here, and pages without an API call never need it
+openai = lazy_import("openai")
+
+# Lower numbers are served first; interactive page requests jump ahead of batch work
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 10
+
+# Requests and tokens per minute allowed for each model
+DEFAULT_RATE_LIMITS = (500, 200000)
+MODEL_RATE_LIMITS = {
+    ANALYSIS_MODEL: (int(os.environ.get("SELF_EVAL_RPM_LIMIT", 500)), int(os.environ.get("SELF_EVAL_TPM_LIMIT", 200000))),
+    EMBEDDING_MODEL: (3000, 1000000)
+}
+
+CLIENT_POOL_SIZE = 64
+
+# How long API key validation results are remembered; failures are re-checked sooner
+VALIDATION_TTL = 60 * 60
+INVALID_VALIDATION_TTL = 60
+
+# Continuously refilling bucket; amounts may be taken once enough has accumulated
+class TokenBucket:
+    def __init__(self, capacity, refill_per_second):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.available = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.refill_per_second)
+        self.updated = now
+
+    # Seconds until the bucket holds the given amount
+    def wait_time(self, amount):
+        return max(0.0, (amount - self.available) / self.refill_per_second)
+
+    def take(self, amount):
+        self.available -= amount
+
+    def give(self, amount):
+        self.available = min(self.capacity, self.available + amount)
+
+# Priority queue in front of a request bucket and a token bucket
+class RequestScheduler:
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.requests = TokenBucket(requests_per_minute, requests_per_minute / 60)
+        self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60)
+        self.condition = threading.Condition()
+        self.queue = []
+        self.sequence = itertools.count()
+        self.completed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    # Blocks until this request is at the head of the queue and both buckets can cover it
+    def acquire(self, tokens, priority=PRIORITY_INTERACTIVE):
+        # A request larger than the whole bucket would otherwise wait forever
+        tokens = min(tokens, self.tokens.capacity)
+        entry = (priority, next(self.sequence))
+        start = time.monotonic()
+
+        with self.condition:
+            heapq.heappush(self.queue, entry)
+            while True:
+                now = time.monotonic()
+                self.requests.refill(now)
+                self.tokens.refill(now)
+                timeout = None
+                if self.queue[0] == entry:
+                    timeout = max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+                    if timeout <= 0:
+                        heapq.heappop(self.queue)
+                        self.requests.take(1)
+                        self.tokens.take(tokens)
+                        waited = now - start
+                        self.completed += 1
+                        self.total_wait += waited
+                        self.max_wait = max(self.max_wait, waited)
+                        self.condition.notify_all()
+                        return tokens
+                self.condition.wait(timeout)
+
+    # Settles a reservation once real usage is known; negative when usage beat the estimate
+    def release(self, tokens):
+        if tokens == 0:
+            return
+        with self.condition:
+            self.tokens.refill(time.monotonic())
+            self.tokens.give(tokens)
+            self.condition.notify_all()
+
+    def stats(self):
+        with self.condition:
+            return {
+                "queue_depth": len(self.queue),
+                "completed": self.completed,
+                "average_wait": self.total_wait / self.completed if self.completed else 0.0,
+                "max_wait": self.max_wait
+            }
+
+_lock = threading.Lock()
+_clients = OrderedDict()
+_schedulers = {}
+_validations = {}
+# Random per process, so remembered validation results can't be matched to keys elsewhere
+_validation_salt = os.urandom(16)
+_validation_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="api-key-check")
+# HTTP attempts made by the current thread's API call, including the OpenAI client's own retries
+_http_attempts = threading.local()
+
+# Function to count every HTTP response, so retried calls show up in traces
+def count_http_attempt(response):
+    _http_attempts.count = getattr(_http_attempts, "count", 0) + 1
+
+# Function to hash an API key so raw keys are never used as dictionary keys
+def api_key_hash(api_key):
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+# Function to get the shared scheduler for one API key and model
+def get_scheduler(key_hash, model):
+    with _lock:
+        scheduler = _schedulers.get((key_hash, model))
+        if scheduler is None:
+            scheduler = _schedulers[(key_hash, model)] = RequestScheduler(*MODEL_RATE_LIMITS.get(model, DEFAULT_RATE_LIMITS))
+        return scheduler
+
+# Function to estimate the prompt tokens of a list of chat messages
+def estimate_chat_tokens(messages):
+    encoding = get_encoding()
+    # Each message carries a few tokens of role/formatting overhead, and the reply is primed with 3
+    return sum(len(encoding.encode_ordinary(message["content"])) + 4 for message in messages) + 3
+
+# Function to estimate the tokens of an embeddings input
+def estimate_embedding_tokens(texts):
+    if isinstance(texts, str):
+        texts = [texts]
+    return sum(len(tokens) for tokens in get_encoding(EMBEDDING_MODEL).encode_ordinary_batch(texts))
+
+# Stream wrapper that settles the token reservation and finishes the call's span once consumed
+class TracedStream:
+    def __init__(self, stream, span, scheduler, reserved):
+        self.stream = stream
+        self.span = span
+        self.scheduler = scheduler
+        self.reserved = reserved
+
+    def __iter__(self):
+        usage = None
+        try:
+            for chunk in self.stream:
+                if "first_token_seconds" not in self.span.record:
+                    self.span.set(first_token_seconds=round(time.perf_counter() - self.span.start, 4))
+                # Requested with include_usage, the last chunk carries the usage of the whole stream
+                if getattr(chunk, "usage", None) is not None:
+                    usage = chunk.usage
+                yield chunk
+        except Exception as e:
+            self.span.finish(e)
+            raise
+        finally:
+            if usage is not None:
+                self.scheduler.release(self.reserved - usage.total_tokens)
+                self.span.set_usage(usage.prompt_tokens, usage.completion_tokens)
+            self.span.finish()
+
+# Pooled OpenAI client whose chat and embeddings calls go through the shared schedulers
+class ScheduledClient:
+    def __init__(self, client, key_hash, priority=PRIORITY_INTERACTIVE, trace=None):
+        self.client = client
+        self.key_hash = key_hash
+        self.priority = priority
+        self.trace = trace
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create_chat_completion))
+        self.embeddings = SimpleNamespace(create=self.create_embedding)
+        # Model metadata calls are free and unmetered, so they bypass the schedulers
+        self.models = client.models
+
+    def create_chat_completion(self, **kwargs):
+        reserved = estimate_chat_tokens(kwargs["messages"]) + kwargs.get("max_tokens", 0)
+        return self.scheduled_call("openai.chat", self.client.chat.completions.create, kwargs, reserved)
+
+    def create_embedding(self, **kwargs):
+        return self.scheduled_call("openai.embeddings", self.client.embeddings.create, kwargs, estimate_embedding_tokens(kwargs["input"]))
+
+    def scheduled_call(self, name, create, kwargs, reserved):
+        span = Span(self.trace, name, "openai", model=kwargs["model"], stream=bool(kwargs.get("stream")))
+        scheduler = get_scheduler(self.key_hash, kwargs["model"])
+        try:
+            reserved = scheduler.acquire(reserved, self.priority)
+            span.set(queue_seconds=round(time.perf_counter() - span.start, 4))
+            _http_attempts.count = 0
+            try:
+                response = create(**kwargs)
+            finally:
+                span.set(retries=max(0, _http_attempts.count - 1))
+        except Exception as e:
+            span.finish(e)
+            raise
+
+        # Streams report their usage at the end, so their reservation is settled once consumed
+        if kwargs.get("stream"):
+            return TracedStream(response, span, scheduler, reserved)
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            scheduler.release(reserved - usage.total_tokens)
+            span.set_usage(usage.prompt_tokens, getattr(usage, "completion_tokens", 0))
+        span.finish()
+        return response
+
+# Function to get the pooled, scheduled client for an API key; calls are recorded in the trace if given
+def get_client(api_key, priority=PRIORITY_INTERACTIVE, trace=None):
+    key_hash = api_key_hash(api_key)
+    with _lock:
+        client = _clients.pop(key_hash, None) or openai.OpenAI(
+            api_key=api_key, http_client=openai.DefaultHttpxClient(event_hooks={"response": [count_http_attempt]})
+        )
+        _clients[key_hash] = client
+        while len(_clients) > CLIENT_POOL_SIZE:
+            _clients.popitem(last=False)
+    return ScheduledClient(client, key_hash, priority, trace)
+
+# Function to report queue depth and wait times per model for one API key
+def scheduler_stats(api_key):
+    key_hash = api_key_hash(api_key)
+    with _lock:
+        schedulers = list(_schedulers.items())
+    return {model: scheduler.stats() for (scheduler_key, model), scheduler in schedulers if scheduler_key == key_hash}
+
+# Function to check an API key against the free model metadata endpoint, remembering the result
+def validate_api_key(api_key):
+    validation_key = hashlib.sha256(_validation_salt + api_key.encode("utf-8")).hexdigest()
+    now = time.monotonic()
+    with _lock:
+        remembered = _validations.get(validation_key)
+    if remembered is not None and remembered[1] > now:
+        return remembered[0]
+
+    try:
+        get_client(api_key).models.retrieve(ANALYSIS_MODEL)
+        valid, ttl = True, VALIDATION_TTL
+    except (openai.AuthenticationError, openai.PermissionDeniedError, openai.NotFoundError):
+        valid, ttl = False, INVALID_VALIDATION_TTL
+    except Exception:
+        # Network trouble says nothing about the key, so don't remember it
+        return False
+
+    with _lock:
+        _validations[validation_key] = (valid, now + ttl)
+    return valid
+
+# Function to validate an API key in the background; returns a future resolving to True/False
+def submit_api_key_validation(api_key):
+    return _validation_executor.submit(validate_api_key, api_key)
@@ -0,0 +1,161 @@
+# Headless batch evaluation of a directory of CSV/XLSX achievement trackers
+#
+# Usage: python batch_eval.py trackers/ --output-dir evaluations --workers 4
+#
+# Each file is evaluated with the same prompts and parsing as the Streamlit app. Progress is
+# checkpointed in <output-dir>/manifest.json, so re-running the same command resumes where it
+# stopped and skips parts whose file has not changed.
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from api_client import PRIORITY_BATCH, get_client
+from evaluation import (
+    CACHE_DIR, CHUNK_TOKEN_BUDGET, ResponseCache, build_evaluation_index, call_with_backoff,
+    evaluate_part, get_embedding_store, parse_evaluation, serialize_table
+)
+from ingestion import load_evaluation_file
+from tracing import Trace
+
+SUPPORTED_EXTENSIONS = (".csv", ".xlsx")
+MANIFEST_NAME = "manifest.json"
+
+# Checkpoint manifest recording which parts of which files are finished
+class Manifest:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.entries = json.load(f)
+
+    # Parts already finished for this exact file content; a changed file starts over
+    def completed_parts(self, name, file_hash):
+        entry = self.entries.get(name)
+        if entry is None or entry["sha256"] != file_hash:
+            return set()
+        return set(entry["parts"])
+
+    def record(self, name, file_hash, part=None, status=None, error=None):
+        with self.lock:
+            entry = self.entries.get(name)
+            if entry is None or entry["sha256"] != file_hash:
+                entry = self.entries[name] = {"sha256": file_hash, "parts": [], "status": "pending", "error": None}
+            if part is not None and part not in entry["parts"]:
+                entry["parts"].append(part)
+            if status is not None:
+                entry["status"] = status
+            entry["error"] = error
+            self.save()
+
+    # Write to a temporary file first so an interrupted run never leaves a truncated manifest
+    def save(self):
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, indent=2, sort_keys=True)
+        os.replace(temp_path, self.path)
+
+# Function to hash a file's bytes so edited files are re-evaluated
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+# Function to list the evaluation files in a directory
+def find_evaluation_files(input_dir):
+    return sorted(
+        os.path.join(input_dir, name) for name in os.listdir(input_dir)
+        if name.lower().endswith(SUPPORTED_EXTENSIONS) and not name.startswith("~$")
+    )
+
+# Function to write one part's raw response and parsed sections for an employee
+def write_part_result(output_dir, name, part_number, response):
+    with open(os.path.join(output_dir, f"part{part_number}.md"), "w", encoding="utf-8") as f:
+        f.write(response)
+    with open(os.path.join(output_dir, f"part{part_number}.json"), "w", encoding="utf-8") as f:
+        json.dump({"file": name, "part": part_number, "sections": parse_evaluation(response)}, f, indent=2)
+
+# Function to name a file's result directory; the extension is kept so alice.csv and alice.xlsx don't collide
+def result_directory(output_root, name):
+    stem, extension = os.path.splitext(name)
+    return os.path.join(output_root, f"{stem}-{extension[1:].lower()}")
+
+# Function to evaluate the unfinished parts of one file; query embeddings are shared by every file of a run
+def evaluate_file(client, path, parts, output_root, manifest, cache=None, query_embeddings=None):
+    name = os.path.basename(path)
+    file_hash = file_sha256(path)
+    todo = [part for part in parts if part not in manifest.completed_parts(name, file_hash)]
+    if not todo:
+        return "skipped"
+
+    df = load_evaluation_file(path, name)
+    index = None
+    if serialize_table(df).tokens > CHUNK_TOKEN_BUDGET:
+        _, _, index = call_with_backoff(build_evaluation_index, client, df, get_embedding_store())
+
+    output_dir = result_directory(output_root, name)
+    os.makedirs(output_dir, exist_ok=True)
+    for part in todo:
+        response = call_with_backoff(evaluate_part, client, df, part, cache, index, query_embeddings)
+        write_part_result(output_dir, name, part, response)
+        manifest.record(name, file_hash, part=part)
+
+    manifest.record(name, file_hash, status="done")
+    return f"done ({len(todo)} parts)"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the three-part self-evaluation for every CSV/XLSX file in a directory.")
+    parser.add_argument("input_dir", help="Directory of employee CSV/XLSX files")
+    parser.add_argument("--output-dir", default="evaluations", help="Where per-employee results and the manifest are written")
+    parser.add_argument("--workers", type=int, default=4, help="Number of files evaluated concurrently")
+    parser.add_argument("--parts", type=int, nargs="+", choices=[1, 2, 3], default=[1, 2, 3], help="Parts to evaluate")
+    parser.add_argument("--api-key", default=os.environ.get("OPENAI_API_KEY"), help="OpenAI API key (defaults to OPENAI_API_KEY)")
+    parser.add_argument("--no-cache", action="store_true", help="Skip the shared on-disk response cache")
+    args = parser.parse_args(argv)
+
+    if not args.api_key:
+        parser.error("an OpenAI API key is required (--api-key or OPENAI_API_KEY)")
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+
+    files = find_evaluation_files(args.input_dir)
+    if not files:
+        print(f"No CSV/XLSX files found in {args.input_dir}")
+        return 0
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    manifest = Manifest(os.path.join(args.output_dir, MANIFEST_NAME))
+    cache = None if args.no_cache else ResponseCache(os.path.join(CACHE_DIR, "responses.sqlite3"))
+    # Set SELF_EVAL_TRACE_FILE to keep every call's timing, tokens and retries as JSON lines
+    trace = Trace()
+    client = get_client(args.api_key, priority=PRIORITY_BATCH, trace=trace)
+    # The section queries are the same for every file, so each is embedded once per run
+    query_embeddings = {}
+
+    failures = 0
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = {executor.submit(evaluate_file, client, path, args.parts, args.output_dir, manifest, cache, query_embeddings): path for path in files}
+        for done, future in enumerate(as_completed(futures), 1):
+            name = os.path.basename(futures[future])
+            try:
+                status = future.result()
+            except Exception as e:
+                failures += 1
+                status = f"failed: {str(e)}"
+                manifest.record(name, file_sha256(futures[future]), status="failed", error=str(e))
+            print(f"[{done}/{len(files)}] {name}: {status}", flush=True)
+
+    print(f"Finished {len(files) - failures}/{len(files)} files; results in {args.output_dir}")
+    usage = trace.summary()
+    print(f"{usage['calls']} API calls, {usage['prompt_tokens']:,} prompt + {usage['completion_tokens']:,} completion tokens, "
+          f"~${usage['cost']:.4f}, {usage['retries']} retries")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
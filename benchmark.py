@@ -0,0 +1,240 @@
+# Offline benchmark of ingestion, indexing and evaluation against the local mock OpenAI server
+#
+# Usage: python benchmark.py --sizes 10 1000 100000 --output benchmarks/results.json
+#
+# Synthetic achievement trackers of each size go through the same steps as the Streamlit app:
+# parsing the upload into the data store, getting the shared retrieval index and streaming and
+# parsing each part (EvaluationStream), once cold and once with warm caches. Each step
+# reports wall time, peak Python memory and the requests and tokens the mock server saw. Startup is
+# measured first in a fresh process: how fast the terms screen and Home page render, and whether
+# they pulled in the analysis stack. The whole run is written as JSON so results can be compared
+# between commits.
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import pandas as pd
+
+DEFAULT_SIZES = [10, 100, 1000, 10000, 100000]
+PARTS = [1, 2, 3]
+
+CATEGORIES = ["Upskilling", "Team Contribution", "Quality", "Job Knowledge", "Speed", "Accuracy", "Cost Savings",
+              "Customer Feedback", "Process Improvement", "Innovation", "Mentoring", "Compliance"]
+ACTIONS = ["Delivered", "Automated", "Reviewed", "Led", "Documented", "Trained the team on", "Resolved", "Redesigned",
+           "Migrated", "Audited", "Presented", "Optimized"]
+SUBJECTS = ["the monthly close report", "the onboarding checklist", "customer escalations", "the billing pipeline",
+            "the QA test plan", "supplier invoices", "the incident runbook", "the reporting dashboard",
+            "the data retention policy", "the release process", "regional sales forecasts", "the ticket backlog"]
+FEEDBACK = ["", "", "Praised by the client in the quarterly review", "Manager noted the attention to detail",
+            "Peer recognition award", "Reduced rework for the downstream team"]
+
+# Function to generate a reproducible achievement tracker with the given number of rows
+def synthetic_tracker(rows, seed=0):
+    rng = random.Random(seed + rows)
+    records = []
+    for i in range(rows):
+        action, subject = rng.choice(ACTIONS), rng.choice(SUBJECTS)
+        records.append({
+            "Date": f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            "Category": rng.choice(CATEGORIES),
+            "Project": f"PRJ-{rng.randint(1, 40):03d}",
+            "Achievement": f"{action} {subject} (item {i})",
+            "Outcome": f"{rng.choice(['Saved', 'Cut', 'Improved', 'Handled'])} {rng.randint(2, 60)}% {rng.choice(['time', 'cost', 'errors', 'volume'])}",
+            "Hours": rng.randint(1, 40),
+            "Feedback": rng.choice(FEEDBACK)
+        })
+    return pd.DataFrame.from_records(records)
+
+# Function to encode a tracker the way a user would upload it
+def tracker_bytes(df, file_format):
+    buffer = io.BytesIO()
+    if file_format == "xlsx":
+        df.to_excel(buffer, index=False)
+    else:
+        df.to_csv(buffer, index=False)
+    return buffer.getvalue()
+
+# Function to run one benchmark step, recording time, peak memory and mock server traffic
+def measure(server, name, fn, *args, **kwargs):
+    before = server.stats.snapshot()
+    tracemalloc.reset_peak()
+    start_memory = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    seconds = time.perf_counter() - start
+    after = server.stats.snapshot()
+    step = {"step": name, "seconds": round(seconds, 4),
+            "peak_memory_mb": round((tracemalloc.get_traced_memory()[1] - start_memory) / (1024 * 1024), 2)}
+    step.update({counter: after[counter] - before[counter] for counter in after})
+    return result, step
+
+# Function to evaluate a part the way generate_evaluation_analysis does: cache lookup, then streamed sections
+def evaluate_streamed(client, df, part_number, index, query_embeddings, cache):
+    from evaluation import EvaluationStream, evaluation_cache_key, parse_section
+    if cache.get(evaluation_cache_key(df, part_number)) is not None:
+        return {"cached": True, "first_section_seconds": 0.0, "parse_seconds": 0.0, "sections": None}
+
+    start = time.perf_counter()
+    first_section, parse_seconds, sections = None, 0.0, 0
+    # 429s on the stream request are retried by the OpenAI client itself, as in the app
+    for section in EvaluationStream(client, df, part_number, index, query_embeddings, cache):
+        parse_start = time.perf_counter()
+        parsed = parse_section(section)
+        parse_seconds += time.perf_counter() - parse_start
+        if parsed is not None:
+            sections += 1
+            if first_section is None:
+                first_section = time.perf_counter() - start
+    return {"cached": False, "first_section_seconds": round(first_section or 0.0, 4),
+            "parse_seconds": round(parse_seconds, 4), "sections": sections}
+
+# Function to benchmark one tracker size from upload to all three parts, cold and then warm
+def benchmark_size(server, client, rows, file_format, cache_dir):
+    from data_store import DataStore
+    from evaluation import EmbeddingStore, ResponseCache, baseline_tokens, get_encoding, get_shared_evaluation_index, serialize_table
+
+    df = synthetic_tracker(rows)
+    data = tracker_bytes(df, file_format)
+    result = {"rows": rows, "format": file_format, "file_bytes": len(data), "steps": []}
+
+    # Uploads, indexes and query embeddings go through a data store like the app's shared one
+    data_store = DataStore(os.path.join(cache_dir, f"frames-{rows}"))
+    key, step = measure(server, "parse", data_store.add_upload, data, f"tracker.{file_format}")
+    df = data_store.get_frame(key)
+    result["steps"].append(step)
+    table, step = measure(server, "serialize", serialize_table, df, get_encoding())
+    step.update(table_format=table.format, table_tokens=table.tokens, baseline_tokens=baseline_tokens(df, get_encoding()))
+    result["steps"].append(step)
+
+    cache = ResponseCache(os.path.join(cache_dir, f"responses-{rows}.sqlite3"))
+    embedding_store = EmbeddingStore(os.path.join(cache_dir, f"embeddings-{rows}"))
+    for phase in ("cold", "warm"):
+        index, step = measure(server, f"{phase}:index", get_shared_evaluation_index, client, df, data_store, embedding_store)
+        result["steps"].append(step)
+        for part in PARTS:
+            details, step = measure(server, f"{phase}:part{part}", evaluate_streamed, client, df, part, index, data_store.query_embeddings, cache)
+            step.update(details)
+            result["steps"].append(step)
+
+    result["end_to_end_seconds"] = {
+        phase: round(sum(step["seconds"] for step in result["steps"] if step["step"].startswith(phase) or step["step"] in ("parse", "serialize")), 4)
+        for phase in ("cold", "warm")
+    }
+    result["prompt_tokens"] = sum(step["prompt_tokens"] for step in result["steps"])
+    return result
+
+# Modules the Home page should render without; they load once a file is analyzed
+ANALYSIS_STACK = ["pandas", "numpy", "faiss", "tiktoken", "openpyxl", "openai"]
+
+# Run in a fresh interpreter, so nothing is imported before the clock starts
+STARTUP_PROBE = """
+import json, os, sys, time
+start = time.perf_counter()
+sys.path.insert(0, os.path.dirname(os.path.abspath(sys.argv[1])))
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file(sys.argv[1], default_timeout=120)
+app.run()
+terms = time.perf_counter() - start
+app.session_state["accepted_terms"] = True
+app.run()
+home = time.perf_counter() - start
+loaded_after_home = [name for name in sys.argv[2:] if name in sys.modules]
+rerun_start = time.perf_counter()
+app.run()
+rerun = time.perf_counter() - rerun_start
+stack_start = time.perf_counter()
+import evaluation, ingestion, api_client
+for module in (evaluation.pd, evaluation.np, evaluation.faiss, evaluation.tiktoken, ingestion.openpyxl, api_client.openai):
+    module.__version__
+stack = time.perf_counter() - stack_start
+print(json.dumps({
+    "terms_seconds": round(terms, 4), "home_seconds": round(home, 4), "home_rerun_seconds": round(rerun, 4),
+    "loaded_after_home": loaded_after_home, "analysis_stack_seconds": round(stack, 4),
+    "exceptions": [str(error.value) for error in app.exception]
+}))
+"""
+
+# Function to time the terms screen and Home page in a fresh process, and what they import
+def measure_startup(cache_dir):
+    app_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "self_eval.py")
+    completed = subprocess.run([sys.executable, "-c", STARTUP_PROBE, app_path] + ANALYSIS_STACK, capture_output=True, text=True,
+                               env=dict(os.environ, SELF_EVAL_CACHE_DIR=cache_dir), check=True)
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+# Function to identify the code being benchmarked, so reports from different commits can be told apart
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the evaluation pipeline offline against a mock OpenAI server.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Tracker sizes in rows")
+    parser.add_argument("--format", choices=["csv", "xlsx"], default="csv", help="Upload format to parse")
+    parser.add_argument("--output", default=os.path.join("benchmarks", "results.json"), help="Where the JSON report is written")
+    parser.add_argument("--latency", type=float, default=0.2, help="Mock seconds before a chat response starts")
+    parser.add_argument("--tokens-per-second", type=float, default=80.0, help="Mock completion generation rate")
+    parser.add_argument("--embedding-latency", type=float, default=0.05, help="Mock seconds per embeddings request")
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="Mock answers every Nth request with a 429 (0 disables)")
+    parser.add_argument("--respect-rate-limits", action="store_true",
+                        help="Keep the app's RPM/TPM scheduler limits instead of lifting them for the mock")
+    parser.add_argument("--startup-only", action="store_true", help="Only measure how fast the app's first pages render")
+    args = parser.parse_args(argv)
+
+    # Caches and the client have to point at throwaway locations before the app modules are imported
+    cache_dir = tempfile.mkdtemp(prefix="self-eval-bench-")
+    os.environ["SELF_EVAL_CACHE_DIR"] = cache_dir
+    startup = measure_startup(cache_dir)
+    print(f"Startup: terms screen {startup['terms_seconds']:.2f}s, Home {startup['home_seconds']:.2f}s "
+          f"(rerun {startup['home_rerun_seconds']:.2f}s), analysis stack loaded after Home: {startup['loaded_after_home'] or 'none'}, "
+          f"loading it takes {startup['analysis_stack_seconds']:.2f}s", flush=True)
+    from mock_openai import MockConfig, start_mock_server
+    config = MockConfig(args.latency, args.tokens_per_second, args.rate_limit_every, embedding_latency=args.embedding_latency)
+    server, base_url = start_mock_server(config)
+    os.environ["OPENAI_BASE_URL"] = base_url
+
+    import api_client
+    if not args.respect_rate_limits:
+        for model in api_client.MODEL_RATE_LIMITS:
+            api_client.MODEL_RATE_LIMITS[model] = (10 ** 9, 10 ** 12)
+    client = api_client.get_client("sk-benchmark")
+
+    report = {
+        "commit": git_commit(),
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "mock": vars(config),
+        "respect_rate_limits": args.respect_rate_limits,
+        "startup": startup,
+        "results": []
+    }
+    tracemalloc.start()
+    try:
+        for rows in [] if args.startup_only else args.sizes:
+            result = benchmark_size(server, client, rows, args.format, cache_dir)
+            report["results"].append(result)
+            print(f"{rows:>7} rows: cold {result['end_to_end_seconds']['cold']:.2f}s, warm {result['end_to_end_seconds']['warm']:.2f}s, "
+                  f"{result['prompt_tokens']} prompt tokens, peak {max(step['peak_memory_mb'] for step in result['steps']):.1f} MB", flush=True)
+    finally:
+        tracemalloc.stop()
+        server.shutdown()
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
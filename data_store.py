@@ -0,0 +1,176 @@
+# Process-wide, memory-bounded store for uploaded frames and their retrieval indexes
+#
+# Streamlit sessions keep only handles (content hashes and dataframe keys) in session state; the
+# data itself lives here once per process, so identical uploads from different sessions share one
+# frame and one index. Frames are stored in compact form (categoricals for repetitive columns,
+# Arrow-backed strings for the rest). When the memory cap is reached, the least recently used
+# frames are spilled to disk and indexes are dropped; both come back on the next access, indexes
+# from the persistent embedding store without any API calls.
+import io
+import os
+import threading
+from collections import OrderedDict
+from evaluation import CACHE_DIR, dataframe_key
+from ingestion import content_hash, load_evaluation_file
+from lazy_imports import lazy_import
+
+pd = lazy_import("pandas")
+
+DATA_STORE_MAX_BYTES = int(os.environ.get("SELF_EVAL_DATA_STORE_MB", 512)) * 1024 * 1024
+DATA_STORE_MAX_SPILL_BYTES = 4 * 1024 * 1024 * 1024
+# Text columns with at most this share of distinct values are stored as categoricals
+CATEGORY_MAX_UNIQUE_FRACTION = 0.5
+
+# Function to convert a frame's text columns to compact dtypes; values and dataframe_key are unchanged
+def compact_frame(df):
+    df = df.copy()
+    for column in df.columns:
+        series = df[column]
+        # Newer pandas already reads text as Arrow-backed strings; those can still become categoricals
+        if not (series.dtype == object or isinstance(series.dtype, pd.StringDtype)) or len(series) < 2:
+            continue
+        if series.nunique(dropna=True) <= CATEGORY_MAX_UNIQUE_FRACTION * len(series):
+            df[column] = series.astype("category")
+        elif series.dtype == object and pd.api.types.infer_dtype(series, skipna=True) == "string":
+            df[column] = series.astype("string[pyarrow]")
+    return df
+
+# Function to measure what a frame or FAISS index occupies in memory
+def memory_size(value):
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    return value.ntotal * value.d * 4
+
+# LRU map of frames and indexes with a byte budget; frames overflow to pickle files on disk
+class DataStore:
+    def __init__(self, directory, max_bytes=DATA_STORE_MAX_BYTES, max_spill_bytes=DATA_STORE_MAX_SPILL_BYTES):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_spill_bytes = max_spill_bytes
+        # (kind, key) -> (value, size), least recently used first
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.spills = 0
+        self.reloads = 0
+        self.lock = threading.Lock()
+        # Query embeddings are the same for every upload, so all sessions share them
+        self.query_embeddings = {}
+        # handle -> dataframe_key of its frame, hashed once per upload rather than on every rerun
+        self.frame_keys = {}
+
+    def spill_path(self, key):
+        return os.path.join(self.directory, f"{key}.pkl")
+
+    def get(self, kind, key):
+        with self.lock:
+            entry = self.entries.get((kind, key))
+            if entry is not None:
+                self.entries.move_to_end((kind, key))
+                return entry[0]
+        return None
+
+    def put(self, kind, key, value):
+        size = memory_size(value)
+        with self.lock:
+            previous = self.entries.pop((kind, key), None)
+            if previous is not None:
+                self.bytes -= previous[1]
+            self.entries[(kind, key)] = (value, size)
+            self.bytes += size
+            self.evict()
+        return value
+
+    # Spills least recently used frames and drops indexes until under the cap; the newest entry always stays
+    def evict(self):
+        spilled = False
+        while self.bytes > self.max_bytes and len(self.entries) > 1:
+            (kind, key), (value, size) = self.entries.popitem(last=False)
+            self.bytes -= size
+            if kind == "frame" and not os.path.exists(self.spill_path(key)):
+                value.to_pickle(self.spill_path(key))
+                self.spills += 1
+                spilled = True
+        if spilled:
+            self.trim_spills()
+
+    # Deletes the oldest spill files once they pass their own cap
+    def trim_spills(self):
+        paths = [os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith(".pkl")]
+        paths.sort(key=os.path.getmtime)
+        total = sum(os.path.getsize(path) for path in paths)
+        for path in paths:
+            if total <= self.max_spill_bytes:
+                break
+            total -= os.path.getsize(path)
+            os.remove(path)
+            self.frame_keys.pop(os.path.basename(path)[:-4], None)
+
+    # Returns an upload's handle, parsing and compacting it only if no session has uploaded the same bytes
+    def add_upload(self, data, file_name):
+        key = f"{content_hash(data)}-{file_name.split('.')[-1].lower()}"
+        if self.get_frame(key) is None:
+            self.put_frame(key, load_evaluation_file(io.BytesIO(data), file_name))
+        return key
+
+    # Stores a frame in compact form under a handle and returns the stored frame
+    def put_frame(self, key, df):
+        return self.put("frame", key, compact_frame(df))
+
+    # Returns the frame behind a handle, reloading it from disk if it was spilled; None if it is gone
+    def get_frame(self, key):
+        df = self.get("frame", key)
+        if df is not None:
+            return df
+        path = self.spill_path(key)
+        try:
+            df = pd.read_pickle(path)
+            # Spill files are trimmed oldest first, so mark this one as recently used
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        self.reloads += 1
+        return self.put("frame", key, df)
+
+    # Returns the dataframe_key of the frame behind a handle; None if the frame is gone
+    def frame_key(self, key):
+        with self.lock:
+            frame_key = self.frame_keys.get(key)
+        if frame_key is not None:
+            return frame_key
+        df = self.get_frame(key)
+        if df is None:
+            return None
+        frame_key = dataframe_key(df)
+        with self.lock:
+            self.frame_keys[key] = frame_key
+        return frame_key
+
+    def get_index(self, key):
+        return self.get("index", key)
+
+    def put_index(self, key, index):
+        return self.put("index", key, index)
+
+    def stats(self):
+        with self.lock:
+            frames = sum(1 for kind, _ in self.entries if kind == "frame")
+            return {
+                "frames": frames,
+                "indexes": len(self.entries) - frames,
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "spills": self.spills,
+                "reloads": self.reloads
+            }
+
+_data_store = None
+_data_store_lock = threading.Lock()
+
+# Function to get the process-wide data store
+def get_data_store():
+    global _data_store
+    with _data_store_lock:
+        if _data_store is None:
+            _data_store = DataStore(os.path.join(CACHE_DIR, "frames"))
+        return _data_store
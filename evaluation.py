@@ -0,0 +1,991 @@
+# Core evaluation logic shared by the Streamlit app and the batch CLI; must not import streamlit
+import os
+import csv
+import hashlib
+import io
+import json
+import math
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from lazy_imports import lazy_import
+
+# Imported on first use, so importing this module for its settings and caches stays cheap
+pd = lazy_import("pandas")
+np = lazy_import("numpy")
+faiss = lazy_import("faiss")
+tiktoken = lazy_import("tiktoken")
+openai = lazy_import("openai")
+
+# Directory of the on-disk caches (responses, embeddings, shared frames, evidence and exports)
+CACHE_DIR = os.environ.get("SELF_EVAL_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache"))
+# Concurrent API calls for embedding batches and map-step summaries
+MAP_MAX_WORKERS = 4
+
+# Settings for per-row embeddings and retrieval
+EMBEDDING_MODEL = "text-embedding-ada-002"
+EMBEDDING_BATCH_SIZE = 512
+RETRIEVAL_TOP_K = 8
+
+# Search queries used to retrieve the evidence for each section of each part
+SECTION_QUERIES = {
+    1: {
+        "SO#1 - UPSKILLING & TEAM CONTRIBUTION": "training, certifications, courses, learning new skills, mentoring and knowledge sharing with the team",
+        "SO#2 - QUALITY OUTPUT": "quality of deliverables, reviews, defects, accuracy, client or stakeholder feedback on output",
+        "SO#3 - JOB KNOWLEDGE": "technical expertise, domain knowledge, tools mastered, solving complex problems",
+        "SO#4 - SPEED & ACCURACY": "turnaround time, deadlines met, delivery speed, error rates, productivity metrics",
+        "SO#5 - COST EFFICIENCY": "cost savings, budget, reduced spend, resource optimization, hours saved"
+    },
+    2: {
+        "PROVIDES SUPPORT AND HELP TO OTHERS": "helping teammates, volunteering for ad-hoc tasks, proactive support, peer feedback on teamwork",
+        "RESPECT": "professional conduct, ethics, composure under pressure, respecting others' time",
+        "TRUST": "integrity, transparency, owning and learning from mistakes, acting in the team's best interest",
+        "EXCEED CUSTOMER EXPECTATIONS": "customer-centric problem solving, customer satisfaction, conflict resolution, thorough analysis",
+        "INITIATIVE": "new ideas, taking on challenging tasks, preventing problems, self-development",
+        "CORPORATE RESPONSIBILITY": "volunteering, community outreach, environmental and CSR activities"
+    },
+    3: {
+        "PROCESS IMPROVEMENTS": "process improvements, automation, efficiency gains, streamlined workflows, time saved",
+        "NEW INNOVATIONS": "new products, prototypes, new solutions, innovation proposals, new customer value, revenue impact"
+    }
+}
+
+# Function to fingerprint a dataframe so its index can be reused across reruns
+def dataframe_key(df):
+    digest = hashlib.sha256("\x1f".join(map(str, df.columns)).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+    return digest.hexdigest()
+
+# Function to turn each row into a compact "column: value" document; values are rendered as in
+# prompts, so a blank cell that turns an int column into floats (5 -> 5.0) leaves other rows unchanged
+def row_documents(df):
+    columns = [str(column) for column in df.columns]
+    documents = []
+    for row in df.itertuples(index=False, name=None):
+        cells = [(column, format_cell(value)) for column, value in zip(columns, row)]
+        document = " | ".join(f"{column}: {value}" for column, value in cells if value)
+        # The embeddings endpoint rejects empty strings
+        documents.append(document or "(empty row)")
+    return documents
+
+# Function to hash a text; used to recognize rows and inputs seen in earlier uploads
+def text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+# Function to fingerprint each row by its content, independent of where it sits in the file
+def row_fingerprints(df):
+    return [text_hash(document) for document in row_documents(df)]
+
+# Function to embed texts in batches, sending many inputs per API call
+def embed_texts(client, texts, batch_size=EMBEDDING_BATCH_SIZE):
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+
+    def embed_batch(batch):
+        response = client.embeddings.create(input=batch, model=EMBEDDING_MODEL)
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    with ThreadPoolExecutor(max_workers=max(1, min(MAP_MAX_WORKERS, len(batches)))) as executor:
+        vectors = [vector for batch in executor.map(embed_batch, batches) for vector in batch]
+    return np.array(vectors, dtype="float32")
+
+EMBEDDING_STORE_MAX_BYTES = 1024 * 1024 * 1024
+SQLITE_MAX_VARIABLES = 900
+# Evicted slots are only overwritten after this many seconds, long after any reader has copied them out
+EMBEDDING_SLOT_REUSE_DELAY = 60
+
+# Disk-backed embedding store keyed by text hash. Vectors live in one float32 file that readers
+# memory-map, so every session and process shares the same pages instead of holding copies;
+# SQLite maps keys to slots and tracks recency for eviction.
+class EmbeddingStore:
+    def __init__(self, directory, max_bytes=EMBEDDING_STORE_MAX_BYTES):
+        os.makedirs(directory, exist_ok=True)
+        self.index_path = os.path.join(directory, "index.sqlite3")
+        self.vectors_path = os.path.join(directory, "vectors.f32")
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.mapped = None
+        with self.connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS vectors (key TEXT PRIMARY KEY, slot INTEGER NOT NULL, accessed REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS vectors_accessed ON vectors (accessed)")
+            conn.execute("CREATE TABLE IF NOT EXISTS free_slots (slot INTEGER PRIMARY KEY, freed REAL NOT NULL DEFAULT 0)")
+            # Stores created before slots recorded when they were freed
+            if "freed" not in [row[1] for row in conn.execute("PRAGMA table_info(free_slots)")]:
+                conn.execute("ALTER TABLE free_slots ADD COLUMN freed REAL NOT NULL DEFAULT 0")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        open(self.vectors_path, "ab").close()
+
+    def connect(self):
+        return sqlite3.connect(self.index_path, timeout=30)
+
+    def meta(self, conn, name):
+        row = conn.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def lookup(self, conn, keys):
+        slots = {}
+        for i in range(0, len(keys), SQLITE_MAX_VARIABLES):
+            batch = keys[i:i + SQLITE_MAX_VARIABLES]
+            placeholders = ",".join("?" * len(batch))
+            slots.update(conn.execute(f"SELECT key, slot FROM vectors WHERE key IN ({placeholders})", batch).fetchall())
+        return slots
+
+    # Re-map the vector file whenever it has grown past the slots we need
+    def view(self, dimension, slots_needed):
+        if self.mapped is None or len(self.mapped) < slots_needed:
+            slots = os.path.getsize(self.vectors_path) // (dimension * 4)
+            self.mapped = np.memmap(self.vectors_path, dtype="float32", mode="r", shape=(slots, dimension))
+        return self.mapped
+
+    # Returns read-only views of the stored vectors. Reads share one snapshot without taking the write
+    # lock, so sessions and processes read concurrently; a slot evicted meanwhile is not overwritten
+    # until EMBEDDING_SLOT_REUSE_DELAY has passed.
+    def get_many(self, keys):
+        unique = list(dict.fromkeys(keys))
+        with self.connect() as conn:
+            conn.execute("BEGIN")
+            dimension = self.meta(conn, "dimension")
+            slots = self.lookup(conn, unique) if dimension else {}
+        if not slots:
+            return {}
+        mapped = self.view(dimension, max(slots.values()) + 1)
+        return {key: mapped[slot] for key, slot in slots.items()}
+
+    # Marks vectors as recently used, so storing others does not evict them
+    def touch(self, keys):
+        if not keys:
+            return
+        now = time.time()
+        with self.connect() as conn:
+            conn.executemany("UPDATE vectors SET accessed = ? WHERE key = ?", [(now, key) for key in keys])
+
+    def put_many(self, items):
+        if not items:
+            return
+        with self.lock, self.connect() as conn:
+            # Take the write lock up front so concurrent processes allocate distinct slots
+            conn.execute("BEGIN IMMEDIATE")
+            dimension = self.meta(conn, "dimension")
+            if dimension is None:
+                dimension = len(next(iter(items.values())))
+                conn.execute("INSERT INTO meta (name, value) VALUES ('dimension', ?)", (dimension,))
+            existing = self.lookup(conn, list(items))
+            new_items = [(key, vector) for key, vector in items.items() if key not in existing]
+            if not new_items:
+                return
+
+            now = time.time()
+            free_slots = [row[0] for row in conn.execute(
+                "SELECT slot FROM free_slots WHERE freed <= ? ORDER BY slot LIMIT ?", (now - EMBEDDING_SLOT_REUSE_DELAY, len(new_items))
+            )]
+            conn.executemany("DELETE FROM free_slots WHERE slot = ?", [(slot,) for slot in free_slots])
+            next_slot = self.meta(conn, "slots") or 0
+            appended = len(new_items) - len(free_slots)
+            slots = free_slots + list(range(next_slot, next_slot + appended))
+            conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('slots', ?)", (next_slot + appended,))
+
+            # Vectors are written before their keys are committed, so readers never see a half-written slot
+            with open(self.vectors_path, "r+b") as f:
+                for (key, vector), slot in sorted(zip(new_items, slots), key=lambda item: item[1]):
+                    f.seek(slot * dimension * 4)
+                    f.write(np.asarray(vector, dtype="float32").tobytes())
+            conn.executemany("INSERT INTO vectors (key, slot, accessed) VALUES (?, ?, ?)", [(key, slot, now) for (key, _), slot in zip(new_items, slots)])
+            self.evict(conn, dimension, now)
+
+    # Drops least recently used vectors over the size cap; their slots are reused by later inserts
+    # once readers that looked them up before the eviction are done with them
+    def evict(self, conn, dimension, now):
+        max_entries = max(1, self.max_bytes // (dimension * 4))
+        excess = conn.execute("SELECT COUNT(*) FROM vectors").fetchone()[0] - max_entries
+        if excess <= 0:
+            return
+        evicted = conn.execute("SELECT key, slot FROM vectors ORDER BY accessed LIMIT ?", (excess,)).fetchall()
+        conn.executemany("DELETE FROM vectors WHERE key = ?", [(key,) for key, _ in evicted])
+        conn.executemany("INSERT OR IGNORE INTO free_slots (slot, freed) VALUES (?, ?)", [(slot, now) for _, slot in evicted])
+
+    def stats(self):
+        with self.connect() as conn:
+            entries = conn.execute("SELECT COUNT(*) FROM vectors").fetchone()[0]
+        return {"entries": entries, "bytes": os.path.getsize(self.vectors_path)}
+
+_embedding_store = None
+_embedding_store_lock = threading.Lock()
+
+# Function to get the process-wide embedding store for the embedding model
+def get_embedding_store():
+    global _embedding_store
+    with _embedding_store_lock:
+        if _embedding_store is None:
+            _embedding_store = EmbeddingStore(os.path.join(CACHE_DIR, "embeddings", EMBEDDING_MODEL))
+        return _embedding_store
+
+# Function to embed texts, never sending a text whose embedding is already stored
+def embed_texts_cached(client, texts, store=None):
+    if store is None:
+        return embed_texts(client, texts)
+    keys = [text_hash(text) for text in texts]
+    # Reading first and marking the stored rows as recently used means storing the new ones can't evict them
+    found = store.get_many(keys)
+    store.touch(list(found))
+    missing = [key for key in dict.fromkeys(keys) if key not in found]
+    if missing:
+        texts_by_key = dict(zip(keys, texts))
+        embedded = dict(zip(missing, embed_texts(client, [texts_by_key[key] for key in missing])))
+        store.put_many(embedded)
+        # The new vectors are used as returned; a store smaller than this upload may already have evicted some
+        found.update(embedded)
+    return np.array([found[key] for key in keys], dtype="float32")
+
+# Function to build a cosine-similarity FAISS index over row embeddings
+def build_faiss_index(embeddings):
+    vectors = np.array(embeddings, dtype="float32")
+    faiss.normalize_L2(vectors)
+    index = faiss.IndexFlatIP(vectors.shape[1])
+    index.add(vectors)
+    return index
+
+# Function to embed every row of a dataframe and index it for retrieval; stored rows are not re-embedded
+def build_evaluation_index(client, df, embedding_store=None):
+    documents = row_documents(df)
+    embeddings = embed_texts_cached(client, documents, embedding_store)
+    return documents, embeddings, build_faiss_index(embeddings)
+
+# Function to retrieve the top-k most relevant rows for each section of a part
+def retrieve_section_rows(client, index, part_number, query_embeddings, top_k=RETRIEVAL_TOP_K):
+    queries = SECTION_QUERIES[part_number]
+    missing = [query for query in queries.values() if query not in query_embeddings]
+    if missing:
+        query_embeddings.update(zip(missing, embed_texts(client, missing)))
+
+    vectors = np.array([query_embeddings[query] for query in queries.values()], dtype="float32")
+    faiss.normalize_L2(vectors)
+    _, ids = index.search(vectors, min(top_k, index.ntotal))
+    return {section: sorted(i for i in row_ids if i >= 0) for section, row_ids in zip(queries, ids.tolist())}
+
+# Function to lay out the retrieved rows under the section they were retrieved for
+def build_retrieved_evidence_text(df, section_rows):
+    return "\n\n".join(f"Evidence for {section}:\n{serialize_table(df.iloc[rows], cache=False).text}" for section, rows in section_rows.items())
+
+# Settings for token-budgeted map-reduce analysis of large files
+ANALYSIS_MODEL = "gpt-4o-mini"
+CHUNK_TOKEN_BUDGET = 8000
+CHUNK_BOUNDARY_FRACTION = 0.5
+MAP_MAX_TOKENS = 800
+
+# Evidence each part's map step should extract from a chunk of rows
+MAP_FOCUS = {
+    1: "the five Strategic Objectives: upskilling & team contribution, quality output, job knowledge, speed & accuracy, and cost efficiency",
+    2: "the behavioral competencies: support and help to others, respect, trust, exceeding customer expectations, initiative, and corporate responsibility",
+    3: "process improvements and new innovations, including their scope and measurable impact"
+}
+
+# Function to get the tokenizer used by a model, loading each encoding once per process
+@lru_cache(maxsize=None)
+def get_encoding(model=ANALYSIS_MODEL):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+# Function to group line positions into chunks under a token budget, also cutting after boundary lines
+def group_lines_by_tokens(line_tokens, max_tokens, header_tokens=0, boundaries=None):
+    groups = []
+    current, current_tokens = [], header_tokens
+    for position, tokens in enumerate(line_tokens):
+        # A single oversized line still gets its own chunk rather than being dropped
+        if current and current_tokens + tokens > max_tokens:
+            groups.append(current)
+            current, current_tokens = [], header_tokens
+        current.append(position)
+        current_tokens += tokens
+        if boundaries is not None and boundaries[position]:
+            groups.append(current)
+            current, current_tokens = [], header_tokens
+
+    if current:
+        groups.append(current)
+    return groups
+
+# Function to pick chunk boundaries from line content, so unchanged lines land in the same chunks on every upload
+def content_boundaries(keys, line_tokens, max_tokens):
+    average_tokens = max(1.0, sum(line_tokens) / len(line_tokens)) if line_tokens else 1.0
+    # Aim for chunks about half the budget; a power of two keeps the spacing stable as the file grows
+    spacing = 2 ** max(0, round(math.log2(max(1.0, max_tokens * CHUNK_BOUNDARY_FRACTION / average_tokens))))
+    return [int(key[:8], 16) % spacing == 0 for key in keys]
+
+# Function to split text lines into chunks that stay under a token budget
+def chunk_lines_by_tokens(lines, max_tokens, header="", encoding=None, content_defined=False):
+    encoding = encoding or get_encoding()
+    header_tokens = len(encoding.encode_ordinary(header)) if header else 0
+    line_tokens = [len(tokens) for tokens in encoding.encode_ordinary_batch(lines)]
+    boundaries = content_boundaries([text_hash(line) for line in lines], line_tokens, max_tokens) if content_defined else None
+
+    groups = group_lines_by_tokens(line_tokens, max_tokens, header_tokens, boundaries)
+    return ["\n".join(([header] if header else []) + [lines[position] for position in group]) for group in groups]
+
+# Settings for compact table serialization; cached tables are held to a byte budget of their text
+SERIALIZATION_CACHE_MAX_BYTES = 64 * 1024 * 1024
+DICTIONARY_MIN_VALUE_LENGTH = 8
+
+# A table serialized for a prompt: header lines are repeated in every chunk, rows are chunked
+class SerializedTable:
+    def __init__(self, table_format, header, rows, tokens=0, dropped_columns=(), fingerprints=(), header_tokens=0, line_tokens=()):
+        self.format = table_format
+        self.header = header
+        self.rows = rows
+        self.fingerprints = list(fingerprints)
+        self.tokens = tokens
+        self.dropped_columns = list(dropped_columns)
+        # Token counts of the header and of each row line, kept so chunking does not re-encode them
+        self.header_tokens = header_tokens
+        self.line_tokens = list(line_tokens)
+
+    @property
+    def text(self):
+        return "\n".join(self.header + self.rows)
+
+    # Approximate memory held by the serialized lines and row fingerprints
+    @property
+    def size(self):
+        return sum(map(len, self.header)) + sum(map(len, self.rows)) + 64 * len(self.fingerprints) + 8 * len(self.line_tokens)
+
+    # Row positions of each chunk when the table is split under a token budget, with the header repeated in every chunk
+    def chunk_groups(self, max_tokens):
+        if self.tokens <= max_tokens:
+            return [list(range(len(self.rows)))] if self.rows else []
+        boundaries = content_boundaries(self.fingerprints, self.line_tokens, max_tokens)
+        return group_lines_by_tokens(self.line_tokens, max_tokens, self.header_tokens, boundaries)
+
+    # Tokens sent across all chunks; a long header (e.g. a dictionary legend) is paid once per chunk
+    def chunked_tokens(self, max_tokens):
+        groups = self.chunk_groups(max_tokens)
+        if len(groups) <= 1:
+            return self.tokens
+        return len(groups) * self.header_tokens + sum(self.line_tokens) + len(self.rows)
+
+# Function to render a cell compactly; newlines are collapsed so every row stays on one line
+def format_cell(value):
+    if pd.isna(value):
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, pd.Timestamp) and value == value.normalize():
+        return value.strftime("%Y-%m-%d")
+    return " ".join(str(value).split())
+
+# Function to write rows as CSV lines
+def csv_lines(rows):
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\n").writerows(rows)
+    return buffer.getvalue().splitlines()
+
+# Function to serialize as a CSV header plus one CSV line per row
+def serialize_csv(columns, cells):
+    lines = csv_lines([columns] + cells)
+    return lines[:1], lines[1:]
+
+# Function to serialize each row as "column: value" pairs, skipping empty cells
+def serialize_records(columns, cells):
+    rows = [" | ".join(f"{column}: {value}" for column, value in zip(columns, row) if value) for row in cells]
+    return [], rows
+
+# Function to serialize as CSV with long repeated values replaced by short per-column codes
+def serialize_dictionary(columns, cells):
+    legend, codes = [], []
+    for position, column in enumerate(columns):
+        counts = pd.Series([row[position] for row in cells]).value_counts()
+        repeated = [value for value, count in counts.items() if count > 1 and len(value) >= DICTIONARY_MIN_VALUE_LENGTH]
+        column_codes = {value: f"#{i}" for i, value in enumerate(repeated, 1)}
+        codes.append(column_codes)
+        if column_codes:
+            legend.append(f"{column} codes: " + " | ".join(f"{code}={value}" for value, code in column_codes.items()))
+    encoded = [[column_codes.get(value, value) for column_codes, value in zip(codes, row)] for row in cells]
+    header, rows = serialize_csv(columns, encoded)
+    return legend + header, rows
+
+TABLE_SERIALIZERS = {
+    "csv": serialize_csv,
+    "records": serialize_records,
+    "dictionary": serialize_dictionary
+}
+
+_serialization_cache = OrderedDict()
+_serialization_bytes = 0
+_serialization_lock = threading.Lock()
+
+# Function to serialize a dataframe in whichever compact format costs the fewest tokens once split
+# into chunks of max_tokens; whole uploads are cached by frame_key (their dataframe_key, hashed here
+# unless the caller already has it), small one-off subsets (cache=False) are not
+def serialize_table(df, encoding=None, cache=True, max_tokens=CHUNK_TOKEN_BUDGET, frame_key=None):
+    global _serialization_bytes
+    encoding = encoding or get_encoding()
+    cache_key = (frame_key or dataframe_key(df), encoding.name, max_tokens) if cache else None
+    with _serialization_lock:
+        if cache_key in _serialization_cache:
+            _serialization_cache.move_to_end(cache_key)
+            return _serialization_cache[cache_key]
+
+    fingerprints = row_fingerprints(df)
+    columns = [" ".join(str(column).split()) for column in df.columns]
+    cells = [[format_cell(value) for value in row] for row in df.itertuples(index=False, name=None)]
+
+    # Empty columns are dropped outright; constant ones are stated once instead of on every row
+    constants, keep = [], []
+    for position, column in enumerate(columns):
+        values = {row[position] for row in cells}
+        if values <= {""}:
+            continue
+        if len(values) == 1 and len(cells) > 1:
+            constants.append(f"{column}: {cells[0][position]}")
+            continue
+        keep.append(position)
+    dropped_columns = [str(df.columns[position]) for position in range(len(columns)) if position not in keep]
+    columns = [columns[position] for position in keep]
+    cells = [[row[position] for position in keep] for row in cells]
+    preface = ["Same for every row: " + " | ".join(constants)] if constants else []
+
+    best, best_cost = None, None
+    for table_format, serializer in TABLE_SERIALIZERS.items():
+        header, rows = serializer(columns, cells)
+        header = preface + header
+        # Counted line by line, one token per line break, so the same counts drive the chunking
+        header_tokens = len(encoding.encode_ordinary("\n".join(header))) if header else 0
+        line_tokens = [len(tokens) for tokens in encoding.encode_ordinary_batch(rows)]
+        tokens = header_tokens + sum(line_tokens) + (len(rows) if header else max(0, len(rows) - 1))
+        candidate = SerializedTable(table_format, header, rows, tokens, dropped_columns, fingerprints, header_tokens, line_tokens)
+        cost = candidate.chunked_tokens(max_tokens)
+        if best is None or cost < best_cost:
+            best, best_cost = candidate, cost
+
+    if cache_key is None or best.size > SERIALIZATION_CACHE_MAX_BYTES:
+        return best
+    with _serialization_lock:
+        if cache_key not in _serialization_cache:
+            _serialization_cache[cache_key] = best
+            _serialization_bytes += best.size
+        while _serialization_bytes > SERIALIZATION_CACHE_MAX_BYTES:
+            _, evicted = _serialization_cache.popitem(last=False)
+            _serialization_bytes -= evicted.size
+    return best
+
+BASELINE_CACHE_SIZE = 32
+_baseline_cache = OrderedDict()
+
+# Function to count the tokens of the plain df.to_string() layout the compact formats are compared
+# against; only the upload caption needs it, so it stays off the prompt path and is memoized per upload
+def baseline_tokens(df, encoding=None, frame_key=None):
+    encoding = encoding or get_encoding()
+    cache_key = (frame_key or dataframe_key(df), encoding.name)
+    with _serialization_lock:
+        if cache_key in _baseline_cache:
+            _baseline_cache.move_to_end(cache_key)
+            return _baseline_cache[cache_key]
+    tokens = len(encoding.encode_ordinary(df.to_string()))
+    with _serialization_lock:
+        _baseline_cache[cache_key] = tokens
+        while len(_baseline_cache) > BASELINE_CACHE_SIZE:
+            _baseline_cache.popitem(last=False)
+    return tokens
+
+# Function to split dataframe rows into token-bounded chunks, returning each chunk's text and row fingerprints
+def chunk_rows(df, max_tokens=CHUNK_TOKEN_BUDGET, encoding=None):
+    table = serialize_table(df, encoding, max_tokens=max_tokens)
+    groups = table.chunk_groups(max_tokens)
+    if len(groups) <= 1:
+        return [(table.text, table.fingerprints)] if groups else []
+    return [
+        ("\n".join(table.header + [table.rows[position] for position in group]), [table.fingerprints[position] for position in group])
+        for group in groups
+    ]
+
+# Function to summarize the evidence in one chunk for a given evaluation part (map step)
+def summarize_chunk(client, chunk_text, part_number):
+    chat = client.chat.completions.create(
+        model=ANALYSIS_MODEL,
+        messages=[
+            {"role": "system", "content": "You extract evidence for performance evaluations. Never score or speculate."},
+            {"role": "user", "content": f"""
+            Extract every piece of evidence relevant to {MAP_FOCUS[part_number]} from the records below.
+            - Keep exact dates, metrics, outcomes, project names and feedback
+            - Group bullet points under the category they support
+            - Omit records with no relevant evidence
+
+            Records:
+            {chunk_text}
+            """}
+        ],
+        temperature=0,
+        max_tokens=MAP_MAX_TOKENS
+    )
+    return chat.choices[0].message.content.strip()
+
+# Function to build the cache key of an evidence summary from the rows or text it summarizes
+def summary_cache_key(part_number, content):
+    payload = json.dumps({
+        "summary": part_number,
+        "content": content,
+        "focus": MAP_FOCUS[part_number],
+        "model": ANALYSIS_MODEL,
+        "max_tokens": MAP_MAX_TOKENS
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+# Function to summarize chunks concurrently, preserving their original order; cached summaries are reused
+def summarize_chunks(client, chunks, part_number, cache=None, cache_keys=None, max_workers=MAP_MAX_WORKERS):
+    # Looked up without counting, but still marked as recently used so reused summaries stay cached
+    summaries = [cache.get(key, count=False) for key in cache_keys] if cache is not None else [None] * len(chunks)
+    pending = [i for i, summary in enumerate(summaries) if summary is None]
+    if pending:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(pending))) as executor:
+            for i, summary in zip(pending, executor.map(lambda i: summarize_chunk(client, chunks[i], part_number), pending)):
+                summaries[i] = summary
+                if cache is not None:
+                    cache.set(cache_keys[i], summary)
+    return summaries
+
+# Function to summarize chunks and keep reducing until the summaries fit in one prompt
+def map_reduce_evidence(client, chunks, part_number, max_tokens=CHUNK_TOKEN_BUDGET, encoding=None, cache=None):
+    # Chunk summaries are keyed by their rows, so a re-upload only summarizes chunks with new or changed rows
+    texts = [text for text, _ in chunks]
+    summaries = summarize_chunks(client, texts, part_number, cache, [summary_cache_key(part_number, fingerprints) for _, fingerprints in chunks])
+    while len(summaries) > 1:
+        groups = chunk_lines_by_tokens(summaries, max_tokens, encoding=encoding, content_defined=True)
+        # Stop once everything fits, or when no two summaries can be merged
+        if len(groups) in (1, len(summaries)):
+            break
+        summaries = summarize_chunks(client, groups, part_number, cache, [summary_cache_key(part_number, group) for group in groups])
+
+    return "\n\n".join(f"Evidence summary {i}:\n{summary}" for i, summary in enumerate(summaries, 1))
+
+# Function to build the evidence text for a part, narrowing large files to relevant rows
+def build_achievements_text(client, df, part_number, index=None, query_embeddings=None, cache=None, max_tokens=CHUNK_TOKEN_BUDGET):
+    encoding = get_encoding()
+    table = serialize_table(df, encoding, max_tokens=max_tokens)
+    if table.tokens <= max_tokens:
+        return table.text
+
+    if index is not None:
+        section_rows = retrieve_section_rows(client, index, part_number, {} if query_embeddings is None else query_embeddings)
+        evidence_text = build_retrieved_evidence_text(df, section_rows)
+        if len(encoding.encode_ordinary(evidence_text)) <= max_tokens:
+            return evidence_text
+        # The retrieved rows are still too large for one prompt, so map-reduce only those
+        df = df.iloc[sorted(set().union(*section_rows.values()))]
+
+    # Chunks are only built once map-reduce is certain to run
+    chunks = chunk_rows(df, max_tokens, encoding)
+    if len(chunks) <= 1:
+        return chunks[0][0] if chunks else ""
+    return map_reduce_evidence(client, chunks, part_number, max_tokens, encoding, cache)
+
+# Settings for the final evaluation call of each part
+ANALYSIS_TEMPERATURE = 0.7
+ANALYSIS_MAX_TOKENS = 2000
+
+SYSTEM_PROMPT = """You are an expert performance evaluator.
+                For each Strategic Objective:
+                - Provide specific, measurable achievements
+                - Include concrete examples and metrics
+                - Score strictly based on evidence
+                - Justify each score with clear reasoning
+                Be objective and thorough in your evaluation."""
+
+# Prompt templates for each evaluation part; {achievements_text} is filled with the evidence
+EVALUATION_PROMPTS = {
+    1: """
+            Based strictly on the following data from the uploaded file:
+            {achievements_text}
+
+            Analyze each Strategic Objective (SO) using only the evidence provided. For each SO:
+            1. Provide up to 5 specific bullet points with concrete achievements
+            2. Include exact metrics, dates, and outcomes where available
+            3. Score based solely on documented evidence:
+            - [5] Exceeded all objectives with quantifiable above-target results
+            - [4] Fully achieved all objectives with documented evidence
+            - [3] Achieved most objectives with partial evidence
+            - [2] Limited achievement with minimal evidence
+            - [1] Minimal achievement with weak evidence
+            - [0] No documented achievement
+
+            Format your response exactly as follows:
+
+            SO#1 - UPSKILLING & TEAM CONTRIBUTION
+            JUSTIFICATION:
+            • [Specific achievement with date, metric, and outcome]
+            • [Specific achievement with date, metric, and outcome]
+            • [Specific achievement with date, metric, and outcome]
+            • [Specific achievement with date, metric, and outcome]
+            • [Specific achievement with date, metric, and outcome]
+            SCORE: [X/5]
+            REASONING: [Evidence-based explanation of score]
+
+            SO#2 - QUALITY OUTPUT
+            JUSTIFICATION:
+            • [Specific achievement with date, metric, and outcome]
+            • [Specific achievement with date, metric, and outcome]
+            • [Specific achievement with date, metric, and outcome]
+            • [Specific achievement with date, metric, and outcome]
+            • [Specific achievement with date, metric, and outcome]
+            SCORE: [X/5]
+            REASONING: [Evidence-based explanation of score]
+
+            SO#3 - JOB KNOWLEDGE
+            JUSTIFICATION:
+            • [Specific achievement with date, metric, and outcome]
+            • [Specific achievement with date, metric, and outcome]
+            • [Specific achievement with date, metric, and outcome]
+            • [Specific achievement with date, metric, and outcome]
+            • [Specific achievement with date, metric, and outcome]
+            SCORE: [X/5]
+            REASONING: [Evidence-based explanation of score]
+
+            SO#4 - SPEED & ACCURACY
+            JUSTIFICATION:
+            • [Specific achievement with date, metric, and outcome]
+            • [Specific achievement with date, metric, and outcome]
+            • [Specific achievement with date, metric, and outcome]
+            • [Specific achievement with date, metric, and outcome]
+            • [Specific achievement with date, metric, and outcome]
+            SCORE: [X/5]
+            REASONING: [Evidence-based explanation of score]
+
+            SO#5 - COST EFFICIENCY
+            JUSTIFICATION:
+            • [Specific achievement with date, metric, and outcome]
+            • [Specific achievement with date, metric, and outcome]
+            • [Specific achievement with date, metric, and outcome]
+            • [Specific achievement with date, metric, and outcome]
+            • [Specific achievement with date, metric, and outcome]
+            SCORE: [X/5]
+            REASONING: [Evidence-based explanation of score]
+
+            OVERALL RATING: [Average of all SO scores]/5
+            FINAL ASSESSMENT: [Brief overall performance summary]
+            """,
+
+    2: """
+            Based strictly on the documented evidence provided:
+            {achievements_text}
+
+            Evaluate behavioral competencies using only concrete examples from the data. For each competency:
+            • Provide up to 5 specific instances with dates
+            • Include measurable outcomes where available
+            • Reference specific projects or initiatives
+            • Note team member or stakeholder feedback if documented
+            • Include quantifiable impact where possible
+
+            PROVIDES SUPPORT AND HELP TO OTHERS
+            • Help others accomplish tasks/goals
+            • Show proactiveness in task management
+            • Volunteer for ad-hoc tasks
+            • Peer feedback on teamwork
+            Score: [5] External impact, [4] Department-wide, [3] Project-wide, [2] Team-wide, [1] Individual, [0] No care
+
+            RESPECT
+            • Control of emotions in high-pressure situations
+            • Ethical behavior
+            • Professional conduct
+            • Respecting others' time
+            Score: [5] Consistently Exceeds, [4] Often Exceeds, [3] Meets, [2] Needs Improvement, [1] Not Meeting, [0] Cultural unfit
+
+            TRUST
+            • Accepting/learning from mistakes
+            • Acting in team's best interest
+            • Professional integrity
+            • Work transparency
+            Score: [5] Consistently Exceeds, [4] Often Exceeds, [3] Meets, [2] Needs Improvement, [1] Not Meeting, [0] Trust issue
+
+            EXCEED CUSTOMER EXPECTATIONS
+            • Customer-centric problem solving
+            • Thorough problem analysis
+            • Win-win conflict management
+            Score: [5] Consistently Exceeds, [4] Often Exceeds, [3] Meets, [2] Needs Improvement, [1] Not Meeting, [0] Don't care
+
+            INITIATIVE
+            • Fresh ideas and alignment with company mission
+            • Productive use of idle time
+            • Taking on challenging tasks
+            • Proactive problem prevention
+            • Self-development
+            Score: [5] Consistently Exceeds, [4] Often Exceeds, [3] Meets, [2] Needs Improvement, [1] Not Meeting, [0] No initiative
+
+            CORPORATE RESPONSIBILITY
+            • Volunteer efforts
+            • Promoting environmental policies
+            Score: [5] Active participation, [4] Sometimes participates, [3] Willing to participate
+
+            Format response with detailed JUSTIFICATION (up to 5 bullet points), SCORE (based only on evidence), and REASONING (citing specific examples).
+            """,
+
+    3: """
+            Based exclusively on the documented achievements:
+            {achievements_text}
+
+            Evaluate innovation contributions with specific evidence:
+
+            For each category (PROCESS IMPROVEMENTS and NEW INNOVATIONS):
+            • Cite up to 5 specific implementations or proposals
+            • Include dates of implementation
+            • Document measurable impact (time saved, cost reduced, etc.)
+            • Note the scope of implementation (team/department/company)
+            • Reference any feedback or recognition received
+
+            1. PROCESS IMPROVEMENTS
+            Evaluation Criteria:
+            • Efforts to seek "incremental" or "breakthrough" improvements
+            • Evaluation and improvement of delivery processes for efficiency
+            • Effectiveness and flexibility improvements
+            Score:
+            [5] - Proposed improvement has been implemented company wide and greatly optimized business operation
+            [4] - Proposed improvement has been implemented department wide and optimized business operation
+            [3] - Constantly share process improvement ideas within department at conceptual level
+            [2] - Share process improvement ideas within team level from time to time
+            [1] - No known instance of sharing improvement ideas
+
+            2. NEW INNOVATIONS
+            Evaluation Criteria:
+            • Business innovation that improves existing products/services/processes
+            • Solutions that create new customer value
+            • Innovation that drives revenue through existing segments
+            • Improvements to productivity or performance
+            Score:
+            [5] - Full implementation
+            [4] - Created prototype and testable product
+            [3] - Identify valuable and viable ideas
+            [2] - Ideation
+            [1] - No known instance of sharing innovation proposal
+
+            Format your response with detailed JUSTIFICATION (up to 5 bullet points), SCORE (based on documented evidence), and REASONING (citing specific implementations).
+            """
+}
+
+# Settings for the on-disk LLM response cache
+RESPONSE_CACHE_MAX_BYTES = 200 * 1024 * 1024
+RESPONSE_CACHE_MAX_AGE = 30 * 24 * 60 * 60
+
+# Content-addressed response cache stored in SQLite, evicted by age and least recent use
+class ResponseCache:
+    def __init__(self, path, max_bytes=RESPONSE_CACHE_MAX_BYTES, max_age=RESPONSE_CACHE_MAX_AGE):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self.connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    response TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created REAL NOT NULL,
+                    accessed REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+
+    # A short-lived connection per operation keeps the cache safe across threads and processes
+    def connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    # Hits and misses measure repeated analyses; other lookups (chunk summaries) pass count=False
+    def get(self, key, count=True):
+        now = time.time()
+        with self.lock, self.connect() as conn:
+            row = conn.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.max_age:
+                self.misses += count
+                return None
+            conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self.hits += count
+            return row[0]
+
+    # Like get, without counting a hit or miss or refreshing the entry's last use
+    def peek(self, key):
+        with self.connect() as conn:
+            row = conn.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+        return row[0] if row is not None and time.time() - row[1] <= self.max_age else None
+
+    def set(self, key, response):
+        now = time.time()
+        with self.lock, self.connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, response, len(response.encode("utf-8")), now, now)
+            )
+            self.evict(conn, now)
+
+    def evict(self, conn, now):
+        conn.execute("DELETE FROM responses WHERE created < ?", (now - self.max_age,))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in conn.execute("SELECT key, size FROM responses ORDER BY accessed").fetchall():
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def stats(self):
+        with self.connect() as conn:
+            entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": size}
+
+# Function to build the cache key for one part of an analysis
+def evaluation_cache_key(df, part_number, frame_key=None):
+    payload = json.dumps({
+        "data": frame_key or dataframe_key(df),
+        "part": part_number,
+        "system": SYSTEM_PROMPT,
+        "prompt": EVALUATION_PROMPTS.get(part_number),
+        "model": ANALYSIS_MODEL,
+        "temperature": ANALYSIS_TEMPERATURE,
+        "max_tokens": ANALYSIS_MAX_TOKENS
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+# Function to build the chat completion arguments for one part
+def build_evaluation_request(client, df, part_number, index=None, query_embeddings=None, cache=None):
+    achievements_text = build_achievements_text(client, df, part_number, index, query_embeddings, cache)
+    return {
+        "model": ANALYSIS_MODEL,
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": EVALUATION_PROMPTS.get(part_number, "Invalid part number").format(achievements_text=achievements_text)}
+        ],
+        "temperature": ANALYSIS_TEMPERATURE,
+        "max_tokens": ANALYSIS_MAX_TOKENS
+    }
+
+# Function to request one part's analysis from the model; safe to call from worker threads
+def request_evaluation(client, df, part_number, index=None, query_embeddings=None, cache=None):
+    chat = client.chat.completions.create(**build_evaluation_request(client, df, part_number, index, query_embeddings, cache))
+    return chat.choices[0].message.content
+
+# Function to stream one part's analysis as text deltas; safe to call from worker threads
+def stream_evaluation(client, df, part_number, index=None, query_embeddings=None, cache=None):
+    request = build_evaluation_request(client, df, part_number, index, query_embeddings, cache)
+    stream = client.chat.completions.create(stream=True, stream_options={"include_usage": True}, **request)
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+# Splits a streamed response into the same blank-line separated sections as the full text
+class SectionStreamParser:
+    def __init__(self):
+        self.buffer = ""
+        self.pieces = []
+
+    # Returns the sections completed by this delta; the trailing partial section stays buffered
+    def feed(self, text):
+        self.pieces.append(text)
+        sections = (self.buffer + text).split("\n\n")
+        self.buffer = sections.pop()
+        return sections
+
+    def close(self):
+        sections, self.buffer = [self.buffer], ""
+        return sections
+
+    @property
+    def response(self):
+        return "".join(self.pieces)
+
+# Headings of the scored sections in Parts 2 and 3
+COMPETENCY_HEADINGS = ("PROVIDES SUPPORT", "RESPECT", "TRUST", "EXCEED CUSTOMER", "INITIATIVE", "CORPORATE")
+INNOVATION_HEADINGS = ("PROCESS IMPROVEMENTS", "NEW INNOVATIONS")
+
+
+# Function to split a full response into the sections the renderer and parser work on
+def split_sections(response):
+    return response.split("\n\n")
+
+# Function to parse one response section into its heading, justification, score and reasoning
+def parse_section(section):
+    if section.startswith("OVERALL"):
+        return {"heading": "Overall Assessment", "text": section}
+    if not section.startswith(("SO#",) + COMPETENCY_HEADINGS + INNOVATION_HEADINGS):
+        return None
+
+    justification_start = section.find("JUSTIFICATION:") + 14
+    justification_end = section.find("SCORE:")
+    reasoning_start = section.find("REASONING:") + 10
+    return {
+        "heading": section.splitlines()[0],
+        "justification": section[justification_start:justification_end].strip(),
+        "score": section[section.find("SCORE:"):].split("\n")[0],
+        "reasoning": section[reasoning_start:].strip()
+    }
+
+# Function to parse a full response into its recognized sections
+def parse_evaluation(response):
+    return [parsed for parsed in map(parse_section, split_sections(response)) if parsed is not None]
+
+# Settings for retrying rate-limited and transient API errors
+RETRY_MAX_ATTEMPTS = 6
+RETRY_BASE_DELAY = 2
+RETRY_MAX_DELAY = 60
+
+# Function to call fn, retrying rate-limit and transient API errors with jittered exponential backoff
+def call_with_backoff(fn, *args, max_attempts=RETRY_MAX_ATTEMPTS, base_delay=RETRY_BASE_DELAY, max_delay=RETRY_MAX_DELAY, **kwargs):
+    for attempt in range(max_attempts):
+        try:
+            return fn(*args, **kwargs)
+        except (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError, openai.InternalServerError):
+            if attempt == max_attempts - 1:
+                raise
+            time.sleep(min(max_delay, base_delay * 2 ** attempt) * random.uniform(0.5, 1.0))
+
+# Function to evaluate one part, going through the response cache when one is given
+def evaluate_part(client, df, part_number, cache=None, index=None, query_embeddings=None):
+    cache_key = evaluation_cache_key(df, part_number)
+    response = cache.get(cache_key) if cache is not None else None
+    if response is None:
+        response = request_evaluation(client, df, part_number, index, query_embeddings, cache)
+        if cache is not None:
+            cache.set(cache_key, response)
+    return response
+
+# Function to get the retrieval index for a frame that is too large for one prompt. Indexes are kept
+# in the given data store (anything with get_index/put_index), and rows embedded before come from
+# the embedding store without API calls. Returns None for files that fit in one prompt.
+def get_shared_evaluation_index(client, df, data_store, embedding_store=None, max_tokens=CHUNK_TOKEN_BUDGET, frame_key=None):
+    key = frame_key or dataframe_key(df)
+    # Only files too large for one prompt are indexed
+    if serialize_table(df, max_tokens=max_tokens, frame_key=key).tokens <= max_tokens:
+        return None
+    index = data_store.get_index(key)
+    if index is None:
+        _, _, index = build_evaluation_index(client, df, embedding_store)
+        data_store.put_index(key, index)
+    return index
+
+# One part's streamed analysis: iterating it yields each section as soon as the stream completes it,
+# and the full response is stored in the cache once the stream ends; safe to use from worker threads
+class EvaluationStream:
+    def __init__(self, client, df, part_number, index=None, query_embeddings=None, cache=None, frame_key=None):
+        self.client = client
+        self.df = df
+        self.frame_key = frame_key
+        self.part_number = part_number
+        self.index = index
+        self.query_embeddings = query_embeddings
+        self.cache = cache
+        self.parser = SectionStreamParser()
+
+    def __iter__(self):
+        for text in stream_evaluation(self.client, self.df, self.part_number, self.index, self.query_embeddings, self.cache):
+            yield from self.parser.feed(text)
+        yield from self.parser.close()
+        if self.cache is not None:
+            self.cache.set(evaluation_cache_key(self.df, self.part_number, self.frame_key), self.response)
+
+    @property
+    def response(self):
+        return self.parser.response
@@ -0,0 +1,236 @@
+# Text extraction and OCR for supporting evidence: PDF reports, DOCX documents and scanned images
+#
+# Extraction runs in a process pool, one task per PDF page, image frame or document, so a long scan
+# neither blocks the Streamlit script thread nor holds the GIL. Jobs are shared process-wide by
+# file hash, and finished results are cached on disk by the same hash. Extracted text becomes rows
+# (Source, Page, Method, Evidence) that join the tracker rows in the usual serialize/chunk/embed
+# pipeline.
+import io
+import json
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from evaluation import CACHE_DIR
+from ingestion import content_hash
+from lazy_imports import lazy_import
+
+pd = lazy_import("pandas")
+
+EVIDENCE_TYPES = ["pdf", "docx", "png", "jpg", "jpeg", "tif", "tiff", "bmp"]
+IMAGE_TYPES = ("png", "jpg", "jpeg", "tif", "tiff", "bmp")
+EVIDENCE_WORKERS = int(os.environ.get("SELF_EVAL_EVIDENCE_WORKERS", max(1, min(8, (os.cpu_count() or 2) - 1))))
+# Pages with less extractable text than this are treated as scans and OCR'd
+OCR_MIN_TEXT_CHARS = 20
+# Extracted text is split into rows of roughly this many characters
+EVIDENCE_ROW_CHARS = 800
+EVIDENCE_JOBS_KEPT = 64
+
+# Function to OCR one image with Tesseract
+def ocr_image(image):
+    import pytesseract
+    return pytesseract.image_to_string(image.convert("RGB"))
+
+# Function to extract one PDF page's text, falling back to OCR of its embedded images for scans
+def extract_pdf_page(path, page_number):
+    from PIL import Image
+    from PyPDF2 import PdfReader
+    page = PdfReader(path).pages[page_number]
+    text = page.extract_text() or ""
+    if len(text.strip()) >= OCR_MIN_TEXT_CHARS:
+        return {"page": page_number + 1, "method": "text", "text": text}
+    scans = [ocr_image(Image.open(io.BytesIO(image.data))) for image in page.images]
+    return {"page": page_number + 1, "method": "ocr", "text": "\n\n".join(scans) or text}
+
+# Function to OCR one frame of an image file; multi-page TIFF scans have several
+def extract_image_frame(path, frame):
+    from PIL import Image
+    with Image.open(path) as image:
+        image.seek(frame)
+        return {"page": frame + 1, "method": "ocr", "text": ocr_image(image)}
+
+# Function to extract a DOCX document's paragraphs and table rows in document order
+def extract_docx(path):
+    import docx
+    from docx.table import Table
+    from docx.text.paragraph import Paragraph
+    document = docx.Document(path)
+    blocks = []
+    # document.paragraphs and document.tables are separate lists, so walk the body's w:p and w:tbl elements instead
+    for element in document.element.body.iterchildren():
+        if element.tag.endswith("}p"):
+            blocks.append(Paragraph(element, document).text)
+        elif element.tag.endswith("}tbl"):
+            blocks.extend(" | ".join(cell.text.strip() for cell in row.cells) for row in Table(element, document).rows)
+    return {"page": 1, "method": "text", "text": "\n\n".join(blocks)}
+
+# Raised in place of a worker's exception, since some (e.g. pytesseract's) cannot be unpickled in the app process
+class EvidenceError(Exception):
+    pass
+
+# Function to run one extraction task in a worker process
+def run_extraction(function, *arguments):
+    try:
+        return function(*arguments)
+    except Exception as e:
+        raise EvidenceError(f"{type(e).__name__}: {e}") from None
+
+# Function to list the extraction tasks of a file: (function, arguments) per page or frame
+def extraction_tasks(path, extension):
+    if extension == "pdf":
+        from PyPDF2 import PdfReader
+        return [(extract_pdf_page, (path, page_number)) for page_number in range(len(PdfReader(path).pages))]
+    if extension == "docx":
+        return [(extract_docx, (path,))]
+    if extension in IMAGE_TYPES:
+        from PIL import Image
+        with Image.open(path) as image:
+            frames = getattr(image, "n_frames", 1)
+        return [(extract_image_frame, (path, frame)) for frame in range(frames)]
+    raise ValueError(f"Unsupported evidence type: {extension}")
+
+# Function to split extracted text into rows of a few paragraphs each
+def text_rows(text, max_chars=EVIDENCE_ROW_CHARS):
+    paragraphs = [" ".join(block.split()) for block in text.replace("\r", "").split("\n\n")]
+    rows, current = [], ""
+    for paragraph in filter(None, paragraphs):
+        if current and len(current) + len(paragraph) + 1 > max_chars:
+            rows.append(current)
+            current = ""
+        current = f"{current} {paragraph}".strip()
+    if current:
+        rows.append(current)
+    return rows
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# Function to get the process-wide extraction pool; spawned workers stay safe beside Streamlit's threads
+def get_process_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=EVIDENCE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+# Function to replace the pool after a worker died (e.g. killed for memory); running jobs record the failure
+def reset_process_pool(broken):
+    global _pool
+    with _pool_lock:
+        if _pool is broken:
+            _pool = None
+    broken.shutdown(wait=False)
+
+# Extraction of one evidence file; pages arrive as workers finish them, results are cached by file hash
+class EvidenceJob:
+    def __init__(self, data, file_name, directory):
+        self.key = content_hash(data)
+        self.file_name = file_name
+        self.extension = file_name.rsplit(".", 1)[-1].lower()
+        self.cache_path = os.path.join(directory, f"{self.key}.json")
+        self.pages = {}
+        self.errors = []
+        self.total = None
+        self.lock = threading.Lock()
+
+        if os.path.exists(self.cache_path):
+            with open(self.cache_path, encoding="utf-8") as f:
+                cached = json.load(f)
+            self.pages = {page["page"]: page for page in cached["pages"]}
+            self.errors = cached["errors"]
+            self.total = len(self.pages) + len(self.errors)
+            return
+
+        # Workers read the file from disk instead of receiving its bytes once per page
+        os.makedirs(directory, exist_ok=True)
+        self.source_path = os.path.join(directory, f"{self.key}.{self.extension}")
+        with open(self.source_path, "wb") as f:
+            f.write(data)
+        try:
+            tasks = extraction_tasks(self.source_path, self.extension)
+        except Exception:
+            os.remove(self.source_path)
+            raise
+        self.total = len(tasks)
+        if not tasks:
+            self.finish()
+        self.pool = get_process_pool()
+        for function, arguments in tasks:
+            self.pool.submit(run_extraction, function, *arguments).add_done_callback(self.task_done)
+
+    def task_done(self, future):
+        with self.lock:
+            try:
+                page = future.result()
+                self.pages[page["page"]] = page
+            except EvidenceError as e:
+                self.errors.append(str(e))
+            except Exception as e:
+                self.errors.append(f"{type(e).__name__}: {e}")
+                if isinstance(e, BrokenProcessPool):
+                    reset_process_pool(self.pool)
+            finished = len(self.pages) + len(self.errors) == self.total
+        if finished:
+            self.finish()
+
+    # Caches the finished pages by file hash and drops the temporary copy of the file; files with
+    # failed pages are neither cached nor remembered, so uploading them again retries (e.g. once
+    # Tesseract is installed)
+    def finish(self):
+        if self.errors:
+            forget_evidence_job(self)
+        else:
+            temp_path = self.cache_path + ".tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump({"pages": [self.pages[number] for number in sorted(self.pages)], "errors": self.errors}, f)
+            os.replace(temp_path, self.cache_path)
+        os.remove(self.source_path)
+
+    @property
+    def completed(self):
+        with self.lock:
+            return len(self.pages) + len(self.errors)
+
+    @property
+    def done(self):
+        return self.completed == self.total
+
+    # Rows for the pages extracted so far, in page order
+    def rows(self):
+        with self.lock:
+            pages = [self.pages[number] for number in sorted(self.pages)]
+        return [
+            {"Source": self.file_name, "Page": page["page"], "Method": page["method"], "Evidence": text}
+            for page in pages for text in text_rows(page["text"])
+        ]
+
+    def frame(self):
+        return pd.DataFrame(self.rows(), columns=["Source", "Page", "Method", "Evidence"])
+
+_jobs = OrderedDict()
+# Reentrant, since a task that finishes during submission completes its job inside get_evidence_job
+_jobs_lock = threading.RLock()
+
+# Function to start (or join) the extraction of an evidence file; identical files share one job
+def get_evidence_job(data, file_name):
+    key = content_hash(data)
+    with _jobs_lock:
+        job = _jobs.get(key)
+        if job is None:
+            job = EvidenceJob(data, file_name, os.path.join(CACHE_DIR, "evidence"))
+            if job.done and job.errors:
+                return job
+            _jobs[key] = job
+        _jobs.move_to_end(key)
+        # Forget the oldest finished jobs; their results stay in the on-disk cache
+        for old_key in [old_key for old_key, old_job in _jobs.items() if old_job.done][:max(0, len(_jobs) - EVIDENCE_JOBS_KEPT)]:
+            del _jobs[old_key]
+        return job
+
+# Function to drop a failed job, unless a newer job for the same file has replaced it
+def forget_evidence_job(job):
+    with _jobs_lock:
+        if _jobs.get(job.key) is job:
+            del _jobs[job.key]
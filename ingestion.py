@@ -0,0 +1,80 @@
+# Reading achievement trackers into dataframes, shared by the Streamlit app and the batch CLI
+import hashlib
+from lazy_imports import lazy_import
+
+pd = lazy_import("pandas")
+openpyxl = lazy_import("openpyxl")
+
+# Settings for spreadsheet ingestion
+XLSX_BATCH_ROWS = 5000
+
+# Function to hash file contents so identical uploads share one parse
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+# Function to name blank header cells and de-duplicate repeated ones the way pandas does
+def clean_header(header):
+    columns, seen = [], {}
+    for position, name in enumerate(header):
+        name = f"Unnamed: {position}" if name is None or str(name).strip() == "" else str(name).strip()
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        columns.append(name)
+    return columns
+
+# Function to stream one read-only worksheet into a dataframe, a batch of rows at a time
+def read_worksheet(worksheet):
+    rows = worksheet.iter_rows(values_only=True)
+    header = None
+    for row in rows:
+        if any(value is not None for value in row):
+            header = clean_header(row)
+            break
+    if header is None:
+        return None
+
+    frames, batch = [], []
+    for row in rows:
+        if all(value is None for value in row):
+            continue
+        # Read-only rows can be shorter or longer than the header
+        batch.append(tuple(row[:len(header)]) + (None,) * (len(header) - len(row)))
+        if len(batch) >= XLSX_BATCH_ROWS:
+            frames.append(pd.DataFrame.from_records(batch, columns=header).infer_objects())
+            batch = []
+    if batch or not frames:
+        frames.append(pd.DataFrame.from_records(batch, columns=header).infer_objects())
+
+    df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+    # Formatting often stretches a sheet's dimensions past its data
+    unnamed_empty = [column for column in df.columns if column.startswith("Unnamed: ") and df[column].isna().all()]
+    return df.drop(columns=unnamed_empty)
+
+# Function to read every non-empty sheet of a workbook in read-only mode
+def read_xlsx_file(file):
+    workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    try:
+        sheets = [(worksheet.title, read_worksheet(worksheet)) for worksheet in workbook.worksheets]
+    finally:
+        workbook.close()
+
+    sheets = [(title, df) for title, df in sheets if df is not None]
+    if not sheets:
+        return pd.DataFrame()
+    if len(sheets) == 1:
+        return sheets[0][1]
+    # Rows from several sheets keep the sheet they came from
+    df = pd.concat([df.assign(Sheet=title) for title, df in sheets], ignore_index=True)
+    return df[["Sheet"] + [column for column in df.columns if column != "Sheet"]]
+
+# Function to read an uploaded or on-disk CSV/XLSX file into a dataframe
+def load_evaluation_file(file, file_name):
+    file_extension = file_name.split('.')[-1].lower()
+    if file_extension == 'csv':
+        return pd.read_csv(file)
+    if file_extension == 'xlsx':
+        return read_xlsx_file(file)
+    raise ValueError(f"Unsupported file type: {file_extension}")
@@ -0,0 +1,29 @@
+# Deferred imports for the heavy analysis stack
+#
+# Streamlit re-runs the page script on every interaction, and the Home page, the terms screen and
+# the sidebar never touch pandas, numpy, faiss, tiktoken, openpyxl or the OpenAI SDK. Modules
+# bound with lazy_import are imported on their first attribute access instead, once per process.
+import importlib
+
+# Module stand-in that imports the real module the first time one of its attributes is used
+class LazyModule:
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    # importlib serializes concurrent first imports, so worker threads can race here safely
+    def _load(self):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return self._module
+
+    # Only called for attributes the stand-in itself doesn't have; underscored names avoid shadowing the module's
+    def __getattr__(self, attribute):
+        return getattr(self._load(), attribute)
+
+    def __repr__(self):
+        return f"<lazy module {self._name!r} ({'loaded' if self._module is not None else 'not loaded'})>"
+
+# Function to bind a module name without importing it yet
+def lazy_import(name):
+    return LazyModule(name)
@@ -0,0 +1,227 @@
+# Local stand-in for the OpenAI chat, embeddings and models endpoints, for offline benchmarks
+#
+# Usage: python mock_openai.py --port 8765 --latency 0.2 --tokens-per-second 80 --rate-limit-every 20
+# then point the app or the batch CLI at it with OPENAI_BASE_URL=http://127.0.0.1:8765/v1
+import argparse
+import base64
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+
+# Latency, generation speed and failure injection of the mock server
+class MockConfig:
+    def __init__(self, latency=0.2, tokens_per_second=80.0, rate_limit_every=0, embedding_dimension=1536,
+                 embedding_latency=0.05, completion_tokens=1200):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.rate_limit_every = rate_limit_every
+        self.embedding_dimension = embedding_dimension
+        self.embedding_latency = embedding_latency
+        self.completion_tokens = completion_tokens
+
+# Request and token counters, read by the benchmark before and after each phase
+class MockStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {
+            "requests": 0, "chat_requests": 0, "embedding_requests": 0, "embedding_inputs": 0,
+            "rate_limited": 0, "prompt_tokens": 0, "completion_tokens": 0, "embedding_tokens": 0
+        }
+
+    def add(self, **amounts):
+        with self.lock:
+            for name, amount in amounts.items():
+                self.counters[name] += amount
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.counters)
+
+# Function to count tokens like the app does, falling back to a length estimate without tiktoken data
+def count_tokens(text):
+    try:
+        from evaluation import get_encoding
+        return len(get_encoding().encode_ordinary(text))
+    except Exception:
+        return max(1, len(text) // 4)
+
+# Headings per part, keyed by text only that part's prompt contains; the Strategic Objectives are the fallback
+SCORED_SECTIONS = {
+    "Evaluate behavioral competencies": ["PROVIDES SUPPORT AND HELP TO OTHERS", "RESPECT", "TRUST", "EXCEED CUSTOMER EXPECTATIONS",
+                                         "INITIATIVE", "CORPORATE RESPONSIBILITY"],
+    "Evaluate innovation contributions": ["PROCESS IMPROVEMENTS", "NEW INNOVATIONS"]
+}
+STRATEGIC_OBJECTIVES = ["SO#1 - UPSKILLING & TEAM CONTRIBUTION", "SO#2 - QUALITY OUTPUT", "SO#3 - JOB KNOWLEDGE",
+                        "SO#4 - SPEED & ACCURACY", "SO#5 - COST EFFICIENCY"]
+
+# Function to build a response in the format the app's prompts ask for
+def canned_completion(prompt, max_tokens, target_tokens):
+    if "Extract every piece of evidence" in prompt:
+        text = "\n".join(f"• Evidence item {i}: delivered milestone on 2024-03-{i % 28 + 1:02d}, reducing turnaround by {i % 40 + 5}%" for i in range(12))
+    else:
+        headings = next((sections for marker, sections in SCORED_SECTIONS.items() if marker in prompt), STRATEGIC_OBJECTIVES)
+        bullets = max(1, target_tokens // (len(headings) * 45))
+        sections = []
+        for number, heading in enumerate(headings, 1):
+            justification = "\n".join(f"• Completed initiative {i + 1} on 2024-0{i % 9 + 1}-15, improving the metric by {10 + i}%" for i in range(bullets))
+            sections.append(f"{heading}\nJUSTIFICATION:\n{justification}\nSCORE: [{number % 5 + 1}/5]\nREASONING: Documented evidence supports this score.")
+        if headings is STRATEGIC_OBJECTIVES:
+            sections.append("OVERALL RATING: 3.0/5\nFINAL ASSESSMENT: Consistent, well-documented performance.")
+        text = "\n\n".join(sections)
+
+    # Trim to max_tokens by words, roughly like a real model hitting its limit
+    words = text.split(" ")
+    limit = max(1, int(max_tokens * 0.75))
+    return " ".join(words[:limit]) if len(words) > limit else text
+
+# Threaded server that stays quiet when a client drops a kept-alive connection
+class MockOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        pass
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def rate_limited(self):
+        config, stats = self.server.config, self.server.stats
+        with stats.lock:
+            self.server.request_number += 1
+            number = self.server.request_number
+        stats.add(requests=1)
+        if config.rate_limit_every and number % config.rate_limit_every == 0:
+            stats.add(rate_limited=1)
+            self.send_json(429, {"error": {"message": "Rate limit reached (mock)", "type": "requests", "code": "rate_limit_exceeded"}},
+                           {"retry-after-ms": "50"})
+            return True
+        return False
+
+    def do_GET(self):
+        if self.path.startswith("/v1/models/"):
+            self.send_json(200, {"id": self.path.rsplit("/", 1)[-1], "object": "model", "created": 0, "owned_by": "mock"})
+        elif self.path == "/v1/models":
+            self.send_json(200, {"object": "list", "data": []})
+        else:
+            self.send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.rate_limited():
+            return
+        if self.path == "/v1/chat/completions":
+            self.chat_completion(payload)
+        elif self.path == "/v1/embeddings":
+            self.embeddings(payload)
+        else:
+            self.send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def chat_completion(self, payload):
+        config, stats = self.server.config, self.server.stats
+        prompt = "\n".join(message["content"] for message in payload["messages"])
+        prompt_tokens = count_tokens(prompt)
+        text = canned_completion(prompt, payload.get("max_tokens", 2000), config.completion_tokens)
+        completion_tokens = count_tokens(text)
+        stats.add(chat_requests=1, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+        base = {"id": "chatcmpl-mock", "created": int(time.time()), "model": payload["model"]}
+        time.sleep(config.latency)
+
+        if not payload.get("stream"):
+            time.sleep(completion_tokens / config.tokens_per_second)
+            self.send_json(200, dict(base, object="chat.completion", usage=usage, choices=[
+                {"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}
+            ]))
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        # Emit roughly one word per token at the configured generation rate
+        words = text.split(" ")
+        step = max(1, len(words) // 50)
+        for i in range(0, len(words), step):
+            piece = " ".join(words[i:i + step]) + (" " if i + step < len(words) else "")
+            self.send_chunk(dict(base, object="chat.completion.chunk", choices=[{"index": 0, "delta": {"content": piece}, "finish_reason": None}]))
+            time.sleep(step / config.tokens_per_second)
+        self.send_chunk(dict(base, object="chat.completion.chunk", choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}]))
+        if (payload.get("stream_options") or {}).get("include_usage"):
+            self.send_chunk(dict(base, object="chat.completion.chunk", choices=[], usage=usage))
+        self.write_chunk(b"data: [DONE]\n\n")
+        self.write_chunk(b"")
+
+    def send_chunk(self, payload):
+        self.write_chunk(f"data: {json.dumps(payload)}\n\n".encode("utf-8"))
+
+    def write_chunk(self, data):
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def embeddings(self, payload):
+        config, stats = self.server.config, self.server.stats
+        inputs = payload["input"] if isinstance(payload["input"], list) else [payload["input"]]
+        tokens = sum(count_tokens(text) for text in inputs)
+        stats.add(embedding_requests=1, embedding_inputs=len(inputs), embedding_tokens=tokens)
+        time.sleep(config.embedding_latency)
+        data = []
+        for i, text in enumerate(inputs):
+            # Deterministic unit vectors, so identical texts always embed identically
+            seed = int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:8], 16)
+            vector = np.random.default_rng(seed).standard_normal(config.embedding_dimension).astype("float32")
+            vector /= np.linalg.norm(vector)
+            # The OpenAI client asks for base64 by default, which is also far cheaper to serve
+            if payload.get("encoding_format") == "base64":
+                embedding = base64.b64encode(vector.tobytes()).decode("ascii")
+            else:
+                embedding = vector.tolist()
+            data.append({"object": "embedding", "index": i, "embedding": embedding})
+        self.send_json(200, {"object": "list", "data": data, "model": payload["model"],
+                             "usage": {"prompt_tokens": tokens, "total_tokens": tokens}})
+
+# Function to start the mock server on a background thread; returns the server and its base URL
+def start_mock_server(config=None, host="127.0.0.1", port=0):
+    server = MockOpenAIServer((host, port), MockOpenAIHandler)
+    server.config = config or MockConfig()
+    server.stats = MockStats()
+    server.request_number = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve mock OpenAI chat, embeddings and models endpoints.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds before a chat response starts")
+    parser.add_argument("--tokens-per-second", type=float, default=80.0, help="Completion generation rate")
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="Answer every Nth request with a 429 (0 disables)")
+    parser.add_argument("--embedding-latency", type=float, default=0.05, help="Seconds per embeddings request")
+    args = parser.parse_args(argv)
+
+    config = MockConfig(args.latency, args.tokens_per_second, args.rate_limit_every, embedding_latency=args.embedding_latency)
+    server, base_url = start_mock_server(config, args.host, args.port)
+    print(f"Mock OpenAI server on {base_url} (set OPENAI_BASE_URL to use it); Ctrl+C to stop", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+# Structured evaluation results and their PDF/DOCX exports
+#
+# A report collects the parsed sections of one or more analysis parts (SO, competency and
+# innovation headings with their justification, score and reasoning). Each file is rendered by a
+# background worker when it is first downloaded and cached on disk under the report's content
+# hash, so the same results are downloaded again instantly, without any API calls.
+import hashlib
+import io
+import json
+import os
+import re
+import threading
+import time
+import zipfile
+from concurrent.futures import Future, ThreadPoolExecutor
+from evaluation import CACHE_DIR, parse_evaluation
+from tracing import Span
+
+PART_TITLES = {
+    1: "Strategic Objectives Evaluation",
+    2: "Behavioral Competencies Evaluation",
+    3: "Innovation Evaluation"
+}
+EXPORT_FORMATS = {
+    "pdf": "application/pdf",
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "zip": "application/zip"
+}
+EXPORT_WORKERS = 2
+EXPORT_CACHE_MAX_BYTES = 200 * 1024 * 1024
+EXPORT_CACHE_MAX_AGE = 30 * 24 * 60 * 60
+# The classic fpdf fonts only cover Latin-1; common typographic characters get plain stand-ins
+PDF_REPLACEMENTS = {"•": "-", "–": "-", "—": "-", "‘": "'", "’": "'", "“": '"', "”": '"', "…": "..."}
+
+# Function to read the numeric score from a "SCORE: [4/5]" line; None if the model gave none
+def parse_score(score):
+    match = re.search(r"(\d+(?:\.\d+)?)", score.split(":", 1)[-1])
+    return float(match.group(1)) if match else None
+
+# The parsed parts of an analysis, keyed by a hash of their content
+class EvaluationReport:
+    def __init__(self, parts):
+        # [{"part": 1, "title": ..., "sections": [parsed sections]}], in part order
+        self.parts = sorted(parts, key=lambda part: part["part"])
+        self.key = hashlib.sha256(json.dumps(self.parts, sort_keys=True).encode("utf-8")).hexdigest()
+
+    @property
+    def name(self):
+        return "self-evaluation-part-" + "-".join(str(part["part"]) for part in self.parts)
+
+    def to_dict(self):
+        return {"key": self.key, "parts": self.parts}
+
+# Function to build a report from raw responses keyed by part number
+def build_report(responses):
+    parts = []
+    for part_number, response in responses.items():
+        sections = parse_evaluation(response)
+        for section in sections:
+            if "score" in section:
+                section["rating"] = parse_score(section["score"])
+        parts.append({"part": part_number, "title": PART_TITLES.get(part_number, f"Part {part_number}"), "sections": sections})
+    return EvaluationReport(parts)
+
+# Function to make text printable with the built-in PDF fonts
+def pdf_text(text):
+    for character, replacement in PDF_REPLACEMENTS.items():
+        text = text.replace(character, replacement)
+    return text.encode("latin-1", "replace").decode("latin-1")
+
+# Function to render a report as PDF bytes
+def render_pdf(report):
+    from fpdf import FPDF
+    pdf = FPDF()
+    pdf.set_auto_page_break(True, margin=15)
+    for part in report.parts:
+        pdf.add_page()
+        pdf.set_font("Arial", "B", 16)
+        pdf.multi_cell(0, 10, pdf_text(f"Part {part['part']}: {part['title']}"))
+        for section in part["sections"]:
+            pdf.ln(4)
+            pdf.set_font("Arial", "B", 12)
+            pdf.multi_cell(0, 7, pdf_text(section["heading"]))
+            pdf.set_font("Arial", "", 11)
+            if "text" in section:
+                pdf.multi_cell(0, 6, pdf_text(section["text"]))
+                continue
+            pdf.multi_cell(0, 6, pdf_text(section["justification"]))
+            pdf.set_font("Arial", "B", 11)
+            pdf.multi_cell(0, 6, pdf_text(section["score"]))
+            pdf.set_font("Arial", "", 11)
+            pdf.multi_cell(0, 6, pdf_text(f"Reasoning: {section['reasoning']}"))
+    # fpdf 1.x returns a Latin-1 string, fpdf2 a bytearray
+    data = pdf.output(dest="S")
+    return data.encode("latin-1") if isinstance(data, str) else bytes(data)
+
+# Function to render a report as DOCX bytes
+def render_docx(report):
+    import docx
+    document = docx.Document()
+    for index, part in enumerate(report.parts):
+        if index:
+            document.add_page_break()
+        document.add_heading(f"Part {part['part']}: {part['title']}", level=1)
+        for section in part["sections"]:
+            document.add_heading(section["heading"], level=2)
+            if "text" in section:
+                document.add_paragraph(section["text"])
+                continue
+            document.add_paragraph(section["justification"])
+            document.add_paragraph().add_run(section["score"]).bold = True
+            reasoning = document.add_paragraph()
+            reasoning.add_run("Reasoning: ").bold = True
+            reasoning.add_run(section["reasoning"])
+    data = io.BytesIO()
+    document.save(data)
+    return data.getvalue()
+
+# Function to bundle the PDF, the DOCX and the structured results into one zip archive
+def render_bundle(report):
+    data = io.BytesIO()
+    with zipfile.ZipFile(data, "w", zipfile.ZIP_DEFLATED) as bundle:
+        bundle.writestr(f"{report.name}.pdf", render_pdf(report))
+        bundle.writestr(f"{report.name}.docx", render_docx(report))
+        bundle.writestr(f"{report.name}.json", json.dumps(report.to_dict(), indent=2))
+    return data.getvalue()
+
+EXPORT_RENDERERS = {
+    "pdf": render_pdf,
+    "docx": render_docx,
+    "zip": render_bundle
+}
+
+# Renders report files in background threads, one format at a time, and keeps them on disk by
+# report hash; old files are evicted by age and, least recently used first, by total size
+class ReportExporter:
+    def __init__(self, directory, max_workers=EXPORT_WORKERS, max_bytes=EXPORT_CACHE_MAX_BYTES, max_age=EXPORT_CACHE_MAX_AGE):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="report-export")
+        # (report key, format) -> future of the file path, while rendering; finished files are found on disk
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def path(self, key, extension):
+        return os.path.join(self.directory, f"{key}.{extension}")
+
+    # Returns a future of one exported file's path, rendering it only if it is neither cached nor in progress
+    def submit(self, report, extension, trace=None):
+        job_key = (report.key, extension)
+        with self.lock:
+            job = self.jobs.get(job_key)
+            if job is not None:
+                return job
+            path = self.path(report.key, extension)
+            if os.path.exists(path) and time.time() - os.path.getmtime(path) <= self.max_age:
+                # A file's modification time is when it was rendered, its access time when it was last used
+                os.utime(path, (time.time(), os.path.getmtime(path)))
+                job = Future()
+                job.set_result(path)
+                return job
+            job = self.jobs[job_key] = self.executor.submit(self.export, report, extension, trace)
+        # Failed exports are forgotten too, so the next request retries them
+        job.add_done_callback(lambda _: self.jobs.pop(job_key, None))
+        return job
+
+    def export(self, report, extension, trace=None):
+        span = Span(trace, "export_report", "export", parts=len(report.parts), format=extension)
+        try:
+            path = self.path(report.key, extension)
+            data = EXPORT_RENDERERS[extension](report)
+            # Written under a temporary name so a download never sees a partial file
+            with open(path + ".tmp", "wb") as f:
+                f.write(data)
+            os.replace(path + ".tmp", path)
+            span.set(bytes=len(data))
+            self.evict()
+            return path
+        except Exception as e:
+            span.finish(e)
+            raise
+        finally:
+            span.finish()
+
+    # Returns one exported file's bytes, rendering it if needed; an export evicted before it was read is rendered again
+    def read(self, report, extension, trace=None):
+        for attempt in range(2):
+            try:
+                with open(self.submit(report, extension, trace).result(), "rb") as f:
+                    return f.read()
+            except FileNotFoundError:
+                if attempt:
+                    raise
+
+    # Deletes files past the maximum age, then the least recently used ones until under the size cap
+    def evict(self):
+        now = time.time()
+        with self.lock:
+            files = []
+            for name in os.listdir(self.directory):
+                path = os.path.join(self.directory, name)
+                if name.endswith(".tmp"):
+                    continue
+                try:
+                    info = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                if now - info.st_mtime > self.max_age:
+                    os.remove(path)
+                else:
+                    files.append((info.st_atime, info.st_size, path))
+            total = sum(size for _, size, _ in files)
+            for _, size, path in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                os.remove(path)
+                total -= size
+
+_exporter = None
+_exporter_lock = threading.Lock()
+
+# Function to get the process-wide report exporter
+def get_report_exporter():
+    global _exporter
+    with _exporter_lock:
+        if _exporter is None:
+            _exporter = ReportExporter(os.path.join(CACHE_DIR, "exports"))
+        return _exporter
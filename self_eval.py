@@ -1,14 +1,25 @@
 # Required imports for application functionality
 import os
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 import streamlit as st
 from streamlit_option_menu import option_menu
-import pandas as pd
-import numpy as np
-import faiss
-from openai import OpenAI
-import tiktoken
-from langchain_community.llms import OpenAI as LangChainOpenAI
-from openpyxl import load_workbook
+from api_client import get_client, scheduler_stats, submit_api_key_validation
+from evaluation import (
+    CACHE_DIR, EvaluationStream, ResponseCache, baseline_tokens, evaluation_cache_key,
+    get_embedding_store, get_shared_evaluation_index, parse_section, row_fingerprints, serialize_table,
+    split_sections
+)
+from data_store import get_data_store
+from evidence import EVIDENCE_TYPES, get_evidence_job
+from ingestion import content_hash
+from lazy_imports import lazy_import
+from reports import EXPORT_FORMATS, PART_TITLES, build_report, get_report_exporter
+from tracing import Trace
+
+# The analysis stack (pandas, numpy, faiss, tiktoken, openpyxl, openai) loads on first use, not on every page
+pd = lazy_import("pandas")
 
 # Configure Streamlit page settings - MUST BE FIRST!
 st.set_page_config(page_title="Self-Eval Assistant", page_icon="", layout="wide")
@@ -24,14 +35,22 @@ if 'index_ready' not in st.session_state:
     st.session_state.index_ready = False
 if 'api_key_valid' not in st.session_state:
     st.session_state.api_key_valid = False
-if 'documents' not in st.session_state:
-    st.session_state.documents = []
-if 'embeddings' not in st.session_state:
-    st.session_state.embeddings = None
-if 'faiss_index' not in st.session_state:
-    st.session_state.faiss_index = None
 if 'nlg_template' not in st.session_state:
     st.session_state.nlg_template = None
+if 'index_key' not in st.session_state:
+    st.session_state.index_key = None
+if 'api_key_check' not in st.session_state:
+    st.session_state.api_key_check = None
+if 'upload_id' not in st.session_state:
+    st.session_state.upload_id = None
+if 'data_key' not in st.session_state:
+    st.session_state.data_key = None
+if 'changed_rows' not in st.session_state:
+    st.session_state.changed_rows = None
+if 'evidence_jobs' not in st.session_state:
+    st.session_state.evidence_jobs = {}
+if 'trace' not in st.session_state:
+    st.session_state.trace = Trace()
 
 # Display warning page for first-time users
 if not st.session_state.accepted_terms:
@@ -72,291 +91,235 @@ if not st.session_state.accepted_terms:
         st.rerun()
     st.stop()
 
-# Function to process evaluation data and create embeddings
-def process_evaluation_data(df):
+# Function to prepare the shared retrieval index, only for files too large for one prompt; sessions with the same data share one index
+def prepare_evaluation_index(df, client, frame_key):
     try:
-        client = OpenAI(api_key=st.session_state.api_key)
-        text_data = df.to_string()
-        response = client.embeddings.create(
-            input=text_data,
-            model="text-embedding-ada-002"
-        )
-        return np.array([response.data[0].embedding])
+        # Rows embedded before (or by another session) come from the embedding store without API calls
+        with st.spinner(f"Indexing {len(df)} rows..."), st.session_state.trace.span("build_index", "index", rows=len(df)):
+            index = get_shared_evaluation_index(client, df, get_data_store(), get_embedding_store(), frame_key=frame_key)
+
+        # Sessions keep only the key; the documents and vectors live in the index and the embedding store
+        if index is not None:
+            st.session_state.index_key = frame_key
+            st.session_state.embeddings_created = True
+            st.session_state.index_ready = True
+            st.session_state.data_processed = True
+        return index
     except Exception as e:
-        st.error(f"Error processing data: {str(e)}")
+        st.error(f"Error processing data: {type(e).__name__}: {str(e)}")
         return None
 
-# Function to generate evaluation analysis
-def generate_evaluation_analysis(df, part_number):
-    try:
-        achievements_text = df.to_string()
-        
-        prompts = {
-            1: f"""
-            Based strictly on the following data from the uploaded file:
-            {achievements_text}
-
-            Analyze each Strategic Objective (SO) using only the evidence provided. For each SO:
-            1. Provide up to 5 specific bullet points with concrete achievements
-            2. Include exact metrics, dates, and outcomes where available
-            3. Score based solely on documented evidence:
-            - [5] Exceeded all objectives with quantifiable above-target results
-            - [4] Fully achieved all objectives with documented evidence
-            - [3] Achieved most objectives with partial evidence
-            - [2] Limited achievement with minimal evidence
-            - [1] Minimal achievement with weak evidence
-            - [0] No documented achievement
-
-            Format your response exactly as follows:
-
-            SO#1 - UPSKILLING & TEAM CONTRIBUTION
-            JUSTIFICATION:
-            • [Specific achievement with date, metric, and outcome]
-            • [Specific achievement with date, metric, and outcome]
-            • [Specific achievement with date, metric, and outcome]
-            • [Specific achievement with date, metric, and outcome]
-            • [Specific achievement with date, metric, and outcome]
-            SCORE: [X/5]
-            REASONING: [Evidence-based explanation of score]
-
-            SO#2 - QUALITY OUTPUT
-            JUSTIFICATION:
-            • [Specific achievement with date, metric, and outcome]
-            • [Specific achievement with date, metric, and outcome]
-            • [Specific achievement with date, metric, and outcome]
-            • [Specific achievement with date, metric, and outcome]
-            • [Specific achievement with date, metric, and outcome]
-            SCORE: [X/5]
-            REASONING: [Evidence-based explanation of score]
-
-            SO#3 - JOB KNOWLEDGE
-            JUSTIFICATION:
-            • [Specific achievement with date, metric, and outcome]
-            • [Specific achievement with date, metric, and outcome]
-            • [Specific achievement with date, metric, and outcome]
-            • [Specific achievement with date, metric, and outcome]
-            • [Specific achievement with date, metric, and outcome]
-            SCORE: [X/5]
-            REASONING: [Evidence-based explanation of score]
-
-            SO#4 - SPEED & ACCURACY
-            JUSTIFICATION:
-            • [Specific achievement with date, metric, and outcome]
-            • [Specific achievement with date, metric, and outcome]
-            • [Specific achievement with date, metric, and outcome]
-            • [Specific achievement with date, metric, and outcome]
-            • [Specific achievement with date, metric, and outcome]
-            SCORE: [X/5]
-            REASONING: [Evidence-based explanation of score]
-
-            SO#5 - COST EFFICIENCY
-            JUSTIFICATION:
-            • [Specific achievement with date, metric, and outcome]
-            • [Specific achievement with date, metric, and outcome]
-            • [Specific achievement with date, metric, and outcome]
-            • [Specific achievement with date, metric, and outcome]
-            • [Specific achievement with date, metric, and outcome]
-            SCORE: [X/5]
-            REASONING: [Evidence-based explanation of score]
-
-            OVERALL RATING: [Average of all SO scores]/5
-            FINAL ASSESSMENT: [Brief overall performance summary]
-            """,
-            
-            2: f"""
-            Based strictly on the documented evidence provided:
-            {achievements_text}
-
-            Evaluate behavioral competencies using only concrete examples from the data. For each competency:
-            • Provide up to 5 specific instances with dates
-            • Include measurable outcomes where available
-            • Reference specific projects or initiatives
-            • Note team member or stakeholder feedback if documented
-            • Include quantifiable impact where possible
-
-            PROVIDES SUPPORT AND HELP TO OTHERS
-            • Help others accomplish tasks/goals
-            • Show proactiveness in task management
-            • Volunteer for ad-hoc tasks
-            • Peer feedback on teamwork
-            Score: [5] External impact, [4] Department-wide, [3] Project-wide, [2] Team-wide, [1] Individual, [0] No care
-
-            RESPECT
-            • Control of emotions in high-pressure situations
-            • Ethical behavior
-            • Professional conduct
-            • Respecting others' time
-            Score: [5] Consistently Exceeds, [4] Often Exceeds, [3] Meets, [2] Needs Improvement, [1] Not Meeting, [0] Cultural unfit
-
-            TRUST
-            • Accepting/learning from mistakes
-            • Acting in team's best interest
-            • Professional integrity
-            • Work transparency
-            Score: [5] Consistently Exceeds, [4] Often Exceeds, [3] Meets, [2] Needs Improvement, [1] Not Meeting, [0] Trust issue
-
-            EXCEED CUSTOMER EXPECTATIONS
-            • Customer-centric problem solving
-            • Thorough problem analysis
-            • Win-win conflict management
-            Score: [5] Consistently Exceeds, [4] Often Exceeds, [3] Meets, [2] Needs Improvement, [1] Not Meeting, [0] Don't care
-
-            INITIATIVE
-            • Fresh ideas and alignment with company mission
-            • Productive use of idle time
-            • Taking on challenging tasks
-            • Proactive problem prevention
-            • Self-development
-            Score: [5] Consistently Exceeds, [4] Often Exceeds, [3] Meets, [2] Needs Improvement, [1] Not Meeting, [0] No initiative
-
-            CORPORATE RESPONSIBILITY
-            • Volunteer efforts
-            • Promoting environmental policies
-            Score: [5] Active participation, [4] Sometimes participates, [3] Willing to participate
-
-            Format response with detailed JUSTIFICATION (up to 5 bullet points), SCORE (based only on evidence), and REASONING (citing specific examples).
-            """,
-            
-            3: f"""
-            Based exclusively on the documented achievements:
-            {achievements_text}
-
-            Evaluate innovation contributions with specific evidence:
-
-            For each category (PROCESS IMPROVEMENTS and NEW INNOVATIONS):
-            • Cite up to 5 specific implementations or proposals
-            • Include dates of implementation
-            • Document measurable impact (time saved, cost reduced, etc.)
-            • Note the scope of implementation (team/department/company)
-            • Reference any feedback or recognition received
-
-            1. PROCESS IMPROVEMENTS
-            Evaluation Criteria:
-            • Efforts to seek "incremental" or "breakthrough" improvements
-            • Evaluation and improvement of delivery processes for efficiency
-            • Effectiveness and flexibility improvements
-            Score:
-            [5] - Proposed improvement has been implemented company wide and greatly optimized business operation
-            [4] - Proposed improvement has been implemented department wide and optimized business operation
-            [3] - Constantly share process improvement ideas within department at conceptual level
-            [2] - Share process improvement ideas within team level from time to time
-            [1] - No known instance of sharing improvement ideas
-
-            2. NEW INNOVATIONS
-            Evaluation Criteria:
-            • Business innovation that improves existing products/services/processes
-            • Solutions that create new customer value
-            • Innovation that drives revenue through existing segments
-            • Improvements to productivity or performance
-            Score:
-            [5] - Full implementation
-            [4] - Created prototype and testable product
-            [3] - Identify valuable and viable ideas
-            [2] - Ideation
-            [1] - No known instance of sharing innovation proposal
-
-            Format your response with detailed JUSTIFICATION (up to 5 bullet points), SCORE (based on documented evidence), and REASONING (citing specific implementations).
-            """
-        }
+# Function to get the process-wide response cache shared by all sessions
+@st.cache_resource
+def get_response_cache():
+    return ResponseCache(os.path.join(CACHE_DIR, "responses.sqlite3"))
 
-        client = OpenAI(api_key=st.session_state.api_key)
-        chat = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": """You are an expert performance evaluator.
-                For each Strategic Objective:
-                - Provide specific, measurable achievements
-                - Include concrete examples and metrics
-                - Score strictly based on evidence
-                - Justify each score with clear reasoning
-                Be objective and thorough in your evaluation."""},
-                {"role": "user", "content": prompts.get(part_number, "Invalid part number")}
-            ],
-            temperature=0.7,
-            max_tokens=2000
-        )
-
-        # Update the UI to display each SO separately
-        response = chat.choices[0].message.content
-        sections = response.split("\n\n")
-        
-        for section in sections:
-            # For Part 1: Strategic Objectives
-            if section.startswith("SO#"):
-                st.markdown(f"### {section.split('\n')[0]}")
-                
-                justification_start = section.find("JUSTIFICATION:") + 14
-                justification_end = section.find("SCORE:")
-                justification = section[justification_start:justification_end].strip()
-                st.markdown(justification)
-                
-                # Updated score styling with black text
-                score_line = section[section.find("SCORE:"):].split("\n")[0]
-                st.markdown(f"""
-                <div style='background-color: #f0f2f6; padding: 10px; border-radius: 5px; width: fit-content;'>
-                <span style='color: black;'><strong>{score_line}</strong></span>
-                </div>
-                """, unsafe_allow_html=True)
-                
-                reasoning_start = section.find("REASONING:") + 10
-                reasoning = section[reasoning_start:].strip()
-                st.markdown(f"**Reasoning:**\n{reasoning}")
-                
-                st.markdown("---")
-            
-            # For Part 2: Behavioral Competencies
-            elif any(section.startswith(comp) for comp in ["PROVIDES SUPPORT", "RESPECT", "TRUST", "EXCEED CUSTOMER", "INITIATIVE", "CORPORATE"]):
-                st.markdown(f"### {section.split('\n')[0]}")
-                
-                justification_start = section.find("JUSTIFICATION:") + 14
-                justification_end = section.find("SCORE:")
-                justification = section[justification_start:justification_end].strip()
-                st.markdown(justification)
-                
-                score_line = section[section.find("SCORE:"):].split("\n")[0]
-                st.markdown(f"""
-                <div style='background-color: #f0f2f6; padding: 10px; border-radius: 5px; width: fit-content;'>
-                <span style='color: black;'><strong>{score_line}</strong></span>
-                </div>
-                """, unsafe_allow_html=True)
-                
-                reasoning_start = section.find("REASONING:") + 10
-                reasoning = section[reasoning_start:].strip()
-                st.markdown(f"**Reasoning:**\n{reasoning}")
-                
-                st.markdown("---")
-            
-            # For Part 3: Innovation
-            elif section.startswith(("PROCESS IMPROVEMENTS", "NEW INNOVATIONS")):
-                st.markdown(f"### {section.split('\n')[0]}")
-                
-                justification_start = section.find("JUSTIFICATION:") + 14
-                justification_end = section.find("SCORE:")
-                justification = section[justification_start:justification_end].strip()
-                st.markdown(justification)
-                
-                score_line = section[section.find("SCORE:"):].split("\n")[0]
-                st.markdown(f"""
-                <div style='background-color: #f0f2f6; padding: 10px; border-radius: 5px; width: fit-content;'>
-                <span style='color: black;'><strong>{score_line}</strong></span>
-                </div>
-                """, unsafe_allow_html=True)
-                
-                reasoning_start = section.find("REASONING:") + 10
-                reasoning = section[reasoning_start:].strip()
-                st.markdown(f"**Reasoning:**\n{reasoning}")
-                
-                st.markdown("---")
-            
-            elif section.startswith("OVERALL"):
-                st.markdown("### Overall Assessment")
-                st.markdown(section)
+# Function to render a parsed section's heading, justification, score badge and reasoning
+def render_scored_section(parsed):
+    st.markdown(f"### {parsed['heading']}")
+    st.markdown(parsed['justification'])
+    
+    # Updated score styling with black text
+    st.markdown(f"""
+    <div style='background-color: #f0f2f6; padding: 10px; border-radius: 5px; width: fit-content;'>
+    <span style='color: black;'><strong>{parsed['score']}</strong></span>
+    </div>
+    """, unsafe_allow_html=True)
+    
+    st.markdown(f"**Reasoning:**\n{parsed['reasoning']}")
+    st.markdown("---")
+
+# Function to render one section of an analysis response
+def render_section(section):
+    parsed = parse_section(section)
+    if parsed is None:
+        return
+    
+    # SO, competency and innovation sections share one layout; the overall rating is shown as-is
+    with st.session_state.trace.span("render_section", "render", heading=parsed['heading']):
+        if "text" in parsed:
+            st.markdown(f"### {parsed['heading']}")
+            st.markdown(parsed['text'])
+        else:
+            render_scored_section(parsed)
+
+# Function to render an analysis response section by section
+def render_evaluation_analysis(response):
+    for section in split_sections(response):
+        render_section(section)
+
+# Function to generate evaluation analysis; frame_key is the upload's dataframe_key, hashed once per upload
+def generate_evaluation_analysis(df, part_number, frame_key):
+    trace = st.session_state.trace
+    try:
+        with trace.span("evaluate_part", "evaluation", part=part_number) as span:
+            cache = get_response_cache()
+            cache_key = evaluation_cache_key(df, part_number, frame_key)
+            response = cache.get(cache_key)
+            span.set(cache_hit=response is not None)
+
+            if response is None:
+                client = get_client(st.session_state.api_key, trace=trace)
+                index = prepare_evaluation_index(df, client, frame_key)
+                stream = EvaluationStream(client, df, part_number, index, get_data_store().query_embeddings, cache, frame_key)
+                # Render each section as soon as the stream completes it; the stream caches the response
+                with st.spinner("Generating analysis..."):
+                    for section in stream:
+                        render_section(section)
+                response = stream.response
+            else:
+                st.caption("Loaded from the response cache")
+                render_evaluation_analysis(response)
 
         return response
     except Exception as e:
-        st.error(f"Error generating analysis: {str(e)}")
+        st.error(f"Error generating analysis: {type(e).__name__}: {str(e)}")
+        return None
+
+# Function to generate all parts concurrently, rendering each one as soon as it finishes
+def generate_all_evaluations(df, containers, frame_key):
+    trace = st.session_state.trace
+    try:
+        cache = get_response_cache()
+        cache_keys = {part: evaluation_cache_key(df, part, frame_key) for part in containers}
+        responses = {}
+        pending = []
+
+        for part, container in containers.items():
+            with trace.span("evaluate_part", "evaluation", part=part) as span:
+                response = cache.get(cache_keys[part])
+                span.set(cache_hit=response is not None)
+                if response is None:
+                    pending.append(part)
+                    continue
+                with container:
+                    st.caption("Loaded from the response cache")
+                    render_evaluation_analysis(response)
+                    st.markdown(response)
+            responses[part] = response
+
+        if not pending:
+            return responses
+
+        client = get_client(st.session_state.api_key, trace=trace)
+        index = prepare_evaluation_index(df, client, frame_key)
+        query_embeddings = get_data_store().query_embeddings
+
+        # Workers stream sections into a queue; only this thread touches the page
+        events = queue.Queue()
+
+        def stream_part(part):
+            stream = EvaluationStream(client, df, part, index, query_embeddings, cache, frame_key)
+            try:
+                with trace.span("stream_part", "evaluation", part=part):
+                    for section in stream:
+                        events.put((part, "section", section))
+                events.put((part, "done", stream.response))
+            except Exception as e:
+                events.put((part, "error", e))
+
+        executor = ThreadPoolExecutor(max_workers=len(pending))
+        try:
+            with st.spinner(f"Generating {len(pending)} parts..."):
+                for part in pending:
+                    executor.submit(stream_part, part)
+
+                remaining = len(pending)
+                while remaining:
+                    part, kind, payload = events.get()
+                    with containers[part]:
+                        if kind == "section":
+                            render_section(payload)
+                            continue
+                        remaining -= 1
+                        if kind == "error":
+                            st.error(f"Error generating analysis: {type(payload).__name__}: {str(payload)}")
+                            continue
+                        st.markdown(payload)
+                        responses[part] = payload
+        finally:
+            # A rerun interrupts this loop without waiting; the workers finish in the background and
+            # cache their responses, so the next run picks them up
+            executor.shutdown(wait=False)
+
+        return responses
+    except Exception as e:
+        st.error(f"Error generating analysis: {type(e).__name__}: {str(e)}")
         return None
 
+# Function to collect the parts of this analysis that have finished, from the response cache
+def finished_responses(df, frame_key):
+    cache = get_response_cache()
+    responses = {part: cache.peek(evaluation_cache_key(df, part, frame_key)) for part in PART_TITLES}
+    return {part: response for part, response in responses.items() if response is not None}
+
+# Function to offer a report's files; each is rendered in the background only when its button is first clicked
+def render_report_downloads(report, extensions, label):
+    exporter = get_report_exporter()
+    trace = st.session_state.trace
+    for column, extension in zip(st.columns(len(extensions)), extensions):
+        with column:
+            # Downloading doesn't rerun the page, so the analyses shown above stay on screen
+            st.download_button(
+                f"{label} ({extension.upper()})", data=partial(exporter.read, report, extension, trace),
+                file_name=f"{report.name}.{extension}", mime=EXPORT_FORMATS[extension], on_click="ignore",
+                key=f"export-{report.key}-{extension}"
+            )
+
+# Function to start (or rejoin) extraction of each evidence upload; a file that can't be opened only gets a warning
+def start_evidence_jobs(files):
+    jobs = []
+    for file in files:
+        # The session keeps its own jobs, so a failed file is retried only when it is uploaded again
+        job = st.session_state.evidence_jobs.get(file.file_id)
+        if job is None:
+            try:
+                with st.session_state.trace.span("extract_evidence", "parse", file_name=file.name, bytes=file.size) as span:
+                    job = get_evidence_job(file.getvalue(), file.name)
+                    span.set(pages=job.total, cache_hit=job.done)
+            except Exception as e:
+                st.warning(f"{file.name} could not be read: {type(e).__name__}: {str(e)}")
+                continue
+            st.session_state.evidence_jobs[file.file_id] = job
+        jobs.append(job)
+    # Forget the jobs of files that were removed from the uploader
+    uploaded = {file.file_id for file in files}
+    for file_id in [file_id for file_id in st.session_state.evidence_jobs if file_id not in uploaded]:
+        del st.session_state.evidence_jobs[file_id]
+    return jobs
+
+# Function to show extraction progress while workers read the pages; reruns the page once every file is done
+@st.fragment(run_every=1)
+def render_evidence_progress(jobs):
+    for job in jobs:
+        st.progress(job.completed / job.total, text=f"Reading {job.file_name}: {job.completed} of {job.total} pages, {len(job.rows()):,} evidence rows so far")
+    if all(job.done for job in jobs):
+        st.rerun()
+
+# Function to append the rows of finished evidence files to the tracker under one shared handle;
+# returns the handle and the frame
+def combine_evidence(data_store, df, data_key, jobs):
+    if not jobs:
+        return data_key, df
+    key = content_hash("+".join([data_key or ""] + [job.key for job in jobs]).encode())
+    combined = data_store.get_frame(key)
+    if combined is None:
+        frames = ([df] if df is not None else []) + [job.frame() for job in jobs]
+        combined = data_store.put_frame(key, pd.concat(frames, ignore_index=True))
+    return key, combined
+
+# Function to show this session's timing spans, their totals and a JSON-lines export
+def render_diagnostics(trace):
+    summary = trace.summary()
+    with st.expander("Diagnostics"):
+        st.caption(f"{summary['calls']} API calls, {summary['prompt_tokens']:,} prompt + {summary['completion_tokens']:,} completion tokens, ~${summary['cost']:.4f}")
+        st.caption(f"{summary['cache_hits']} cache hits, {summary['retries']} retries, {summary['errors']} errors")
+        records = trace.records()
+        if records:
+            columns = ["name", "kind", "seconds", "model", "prompt_tokens", "completion_tokens", "cost", "cache_hit", "retries", "error"]
+            st.dataframe(pd.DataFrame(records[::-1], columns=columns), hide_index=True)
+            st.download_button("Download trace (JSON lines)", trace.to_jsonl(), file_name=f"trace-{trace.trace_id}.jsonl", mime="application/x-ndjson")
+
 # Sidebar setup
 with st.sidebar:
     options = option_menu(
@@ -384,23 +347,29 @@ with st.sidebar:
     with col2:
         check_api = st.button('>', key='api_button')
     
+    # The key is checked in the background and the result shown here once the page has rendered
+    api_key_status = st.empty()
     if check_api:
         if not api_key:
-            st.warning('Please enter your OpenAI API token!')
+            api_key_status.warning('Please enter your OpenAI API token!')
         else:
-            try:
-                client = OpenAI(api_key=api_key)
-                response = client.chat.completions.create(
-                    model="gpt-4o-mini",
-                    messages=[{"role": "user", "content": "Hello"}],
-                    max_tokens=5
-                )
-                st.session_state.api_key = api_key
-                st.session_state.api_key_valid = True
-                st.success('API key is valid!')
-            except Exception as e:
-                st.error('Invalid API key or API error occurred')
-                st.session_state.api_key_valid = False
+            st.session_state.api_key_check = (api_key, submit_api_key_validation(api_key))
+            api_key_status.info('Checking API key...')
+
+    cache_stats = get_response_cache().stats()
+    st.caption(f"Response cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, {cache_stats['entries']} entries")
+    store_stats = get_embedding_store().stats()
+    st.caption(f"Embedding store: {store_stats['entries']:,} vectors, {store_stats['bytes'] / 1024 / 1024:.1f} MB")
+    data_stats = get_data_store().stats()
+    st.caption(f"Shared data: {data_stats['frames']} frames, {data_stats['indexes']} indexes, {data_stats['bytes'] / 1024 / 1024:.1f} of {data_stats['max_bytes'] / 1024 / 1024:.0f} MB, {data_stats['spills']} spilled to disk")
+    
+    # Shared API queue for this key across all sessions
+    if st.session_state.api_key_valid:
+        for model, queue_stats in scheduler_stats(st.session_state.api_key).items():
+            st.caption(f"{model} queue: {queue_stats['queue_depth']} waiting, avg wait {queue_stats['average_wait']:.1f}s, max {queue_stats['max_wait']:.1f}s")
+    
+    # Filled in at the end of the run, so it includes this run's spans
+    diagnostics_panel = st.empty()
 
 # Home page content update
 if options == "Home":
@@ -429,42 +398,115 @@ elif options == "Self Evaluation":
     st.title("Performance Analysis")
     
     uploaded_file = st.file_uploader("Upload your evaluation data (CSV/XLSX)", type=['csv', 'xlsx'])
+    evidence_files = st.file_uploader("Upload supporting evidence (PDF/DOCX/images)", type=EVIDENCE_TYPES, accept_multiple_files=True)
     
-    if uploaded_file is not None:
+    if uploaded_file is not None or evidence_files:
         try:
-            # Check file extension and read accordingly
-            file_extension = uploaded_file.name.split('.')[-1]
+            # The session holds only a handle; the frame is parsed once per distinct upload and shared
+            data_store = get_data_store()
+            df = handle = None
+            if uploaded_file is not None:
+                new_upload = st.session_state.upload_id != uploaded_file.file_id
+                df = None if new_upload else data_store.get_frame(st.session_state.data_key)
+                if df is None:
+                    previous_key = st.session_state.data_key
+                    with st.session_state.trace.span("parse_upload", "parse", file_name=uploaded_file.name, bytes=uploaded_file.size):
+                        st.session_state.data_key = data_store.add_upload(uploaded_file.getvalue(), uploaded_file.name)
+                        df = data_store.get_frame(st.session_state.data_key)
+                    st.session_state.upload_id = uploaded_file.file_id
+                if new_upload:
+                    # Compare against the previous upload so users can see how much work a re-upload costs
+                    previous = data_store.get_frame(previous_key) if previous_key else None
+                    st.session_state.changed_rows = len(set(row_fingerprints(df)) - set(row_fingerprints(previous))) if previous is not None else None
+            
+                if st.session_state.changed_rows is not None:
+                    st.caption(f"{st.session_state.changed_rows:,} of {len(df):,} rows are new or changed since the previous upload; unchanged rows reuse their embeddings and evidence summaries")
+                handle = st.session_state.data_key
             
-            if file_extension == 'csv':
-                df = pd.read_csv(uploaded_file)
-            elif file_extension == 'xlsx':
-                df = pd.read_excel(uploaded_file)
+            # Evidence files are read in worker processes; their rows join the analysis once a file is done
+            if evidence_files:
+                jobs = start_evidence_jobs(evidence_files)
+                pending = [job for job in jobs if not job.done]
+                if pending:
+                    render_evidence_progress(pending)
+                finished = [job for job in jobs if job.done]
+                for job in finished:
+                    if job.errors:
+                        st.warning(f"{len(job.errors)} of {job.total} pages of {job.file_name} could not be read: {job.errors[0]}")
+                handle, df = combine_evidence(data_store, df, handle, finished)
             
-            st.session_state.df = df
+            if df is not None:
+                # Report the prompt tokens saved by the compact table format for this upload
+                # The frame is hashed once per upload; every cache lookup below reuses its key
+                frame_key = data_store.frame_key(handle)
+                table = serialize_table(df, frame_key=frame_key)
+                baseline = baseline_tokens(df, frame_key=frame_key)
+                saved_percent = 100 * (baseline - table.tokens) / baseline if baseline else 0
+                dropped_note = f"; dropped empty/constant columns: {', '.join(table.dropped_columns)}" if table.dropped_columns else ""
+                st.caption(f"Prompt table: {table.format} format, {table.tokens:,} tokens instead of {baseline:,} ({saved_percent:.0f}% saved){dropped_note}")
             
-            # Add tabs for different evaluation parts
-            tab1, tab2, tab3 = st.tabs(["Part 1: Goals", "Part 2: Enablement", "Part 3: Innovation"])
+                # Runs all three parts at once; results land in each tab as they finish
+                generate_all = st.button("Generate All Parts", key="all_parts")
+                bundle_panel = st.empty()
             
-            with tab1:
-                st.header("Strategic Objectives Evaluation")
-                if st.button("Generate Goals Analysis", key="goals"):
-                    analysis = generate_evaluation_analysis(df, 1)
-                    if analysis:
-                        st.markdown(analysis)
+                # Add tabs for different evaluation parts
+                tab1, tab2, tab3 = st.tabs(["Part 1: Goals", "Part 2: Enablement", "Part 3: Innovation"])
+                part_containers = {}
+                export_panels = {}
             
-            with tab2:
-                st.header("Behavioral Competencies Evaluation")
-                if st.button("Generate Enablement Analysis", key="enablement"):
-                    analysis = generate_evaluation_analysis(df, 2)
-                    if analysis:
-                        st.markdown(analysis)
+                with tab1:
+                    st.header("Strategic Objectives Evaluation")
+                    if st.button("Generate Goals Analysis", key="goals"):
+                        analysis = generate_evaluation_analysis(df, 1, frame_key)
+                        if analysis:
+                            st.markdown(analysis)
+                    part_containers[1] = st.container()
+                    export_panels[1] = st.empty()
             
-            with tab3:
-                st.header("Innovation Evaluation")
-                if st.button("Generate Innovation Analysis", key="innovation"):
-                    analysis = generate_evaluation_analysis(df, 3)
-                    if analysis:
-                        st.markdown(analysis)
+                with tab2:
+                    st.header("Behavioral Competencies Evaluation")
+                    if st.button("Generate Enablement Analysis", key="enablement"):
+                        analysis = generate_evaluation_analysis(df, 2, frame_key)
+                        if analysis:
+                            st.markdown(analysis)
+                    part_containers[2] = st.container()
+                    export_panels[2] = st.empty()
+            
+                with tab3:
+                    st.header("Innovation Evaluation")
+                    if st.button("Generate Innovation Analysis", key="innovation"):
+                        analysis = generate_evaluation_analysis(df, 3, frame_key)
+                        if analysis:
+                            st.markdown(analysis)
+                    part_containers[3] = st.container()
+                    export_panels[3] = st.empty()
+            
+                if generate_all:
+                    generate_all_evaluations(df, part_containers, frame_key)
+                
+                # Filled last, so parts generated in this run can be exported right away
+                responses = finished_responses(df, frame_key)
+                for part, response in responses.items():
+                    with export_panels[part].container():
+                        render_report_downloads(build_report({part: response}), ["pdf", "docx"], "Download")
+                if responses:
+                    with bundle_panel.container():
+                        render_report_downloads(build_report(responses), ["zip"], f"Download {len(responses)} of {len(PART_TITLES)} parts")
 
         except Exception as e:
-            st.error(f"Error processing file: {str(e)}")
+            st.error(f"Error processing file: {type(e).__name__}: {str(e)}")
+
+# Finish a pending API key check after the rest of the page has rendered
+if st.session_state.api_key_check is not None:
+    checked_key, key_check = st.session_state.api_key_check
+    st.session_state.api_key_check = None
+    if key_check.result():
+        st.session_state.api_key = checked_key
+        st.session_state.api_key_valid = True
+        api_key_status.success('API key is valid!')
+    else:
+        st.session_state.api_key_valid = False
+        api_key_status.error('Invalid API key or API error occurred')
+
+with diagnostics_panel.container():
+    render_diagnostics(st.session_state.trace)
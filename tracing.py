@@ -0,0 +1,114 @@
+# Timing spans for OpenAI calls, file parses and render steps, exported as JSON-lines traces
+#
+# Each Streamlit session (or batch run) records into its own Trace. Finished spans are kept in
+# memory for the diagnostics panel and, when SELF_EVAL_TRACE_FILE is set, appended to that file
+# as one JSON object per line so traces from every session can be analyzed together.
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from evaluation import ANALYSIS_MODEL, EMBEDDING_MODEL
+
+# US dollars per million prompt and completion tokens, for cost estimates
+MODEL_PRICES = {
+    ANALYSIS_MODEL: (0.15, 0.60),
+    EMBEDDING_MODEL: (0.10, 0.0)
+}
+
+TRACE_MAX_SPANS = 500
+TRACE_FILE = os.environ.get("SELF_EVAL_TRACE_FILE")
+
+_file_lock = threading.Lock()
+
+# Function to estimate the dollar cost of a call from its token usage
+def estimate_cost(model, prompt_tokens, completion_tokens=0):
+    prompt_price, completion_price = MODEL_PRICES.get(model, (0.0, 0.0))
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+# One timed step; attributes can be added until it finishes
+class Span:
+    def __init__(self, trace, name, kind, **attributes):
+        self.trace = trace
+        self.start = time.perf_counter()
+        self.record = {
+            "trace_id": trace.trace_id if trace is not None else None,
+            "span_id": uuid.uuid4().hex[:16],
+            "name": name,
+            "kind": kind,
+            "started": time.time(),
+            **attributes
+        }
+        self.finished = False
+
+    def set(self, **attributes):
+        self.record.update(attributes)
+
+    # Records token usage and its estimated cost for the span's model
+    def set_usage(self, prompt_tokens, completion_tokens=0):
+        self.record.update(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            cost=round(estimate_cost(self.record.get("model"), prompt_tokens, completion_tokens), 6)
+        )
+
+    def finish(self, error=None):
+        if self.finished:
+            return
+        self.finished = True
+        self.record["seconds"] = round(time.perf_counter() - self.start, 4)
+        if error is not None:
+            self.record["error"] = f"{type(error).__name__}: {error}"
+        if self.trace is not None:
+            self.trace.add(self.record)
+
+# Bounded, thread-safe collection of finished spans for one session or run
+class Trace:
+    def __init__(self, trace_id=None, max_spans=TRACE_MAX_SPANS, path=TRACE_FILE):
+        self.trace_id = trace_id or uuid.uuid4().hex[:12]
+        self.spans = deque(maxlen=max_spans)
+        self.path = path
+        self.lock = threading.Lock()
+
+    def add(self, record):
+        with self.lock:
+            self.spans.append(record)
+        if self.path:
+            with _file_lock, open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+
+    @contextmanager
+    def span(self, name, kind, **attributes):
+        span = Span(self, name, kind, **attributes)
+        try:
+            yield span
+        except Exception as e:
+            span.finish(e)
+            raise
+        finally:
+            span.finish()
+
+    def records(self):
+        with self.lock:
+            return list(self.spans)
+
+    def to_jsonl(self):
+        return "".join(json.dumps(record) + "\n" for record in self.records())
+
+    # Totals over the recorded spans, for the diagnostics panel
+    def summary(self):
+        records = self.records()
+        calls = [record for record in records if record["kind"] == "openai"]
+        return {
+            "spans": len(records),
+            "calls": len(calls),
+            "prompt_tokens": sum(record.get("prompt_tokens", 0) for record in calls),
+            "completion_tokens": sum(record.get("completion_tokens", 0) for record in calls),
+            "cost": sum(record.get("cost", 0.0) for record in calls),
+            "cache_hits": sum(1 for record in records if record.get("cache_hit")),
+            "retries": sum(record.get("retries", 0) for record in calls),
+            "errors": sum(1 for record in records if "error" in record)
+        }
+